@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+"""
+Measure the latency and throughput of the Client against the local
+stand-in for the open data portal of the tests (tests/server.py), which
+serves synthetic data and index files laid out as on the portal, hourly
+(oper) and monthly (mmsf):
+
+- retrieve: fields selected with the index files, downloaded with
+  multi-range requests, or one range per request when the server does
+  not accept multiple ranges (single);
+- download: whole data files;
+- get_parts: index files only;
+- latest: probing of the most recent run.
+
+Each is run on small, medium and large requests. The server answers
+each request after --delay seconds, to stand for the network latency.
+
+The progress bars of the downloads are shown on stderr:
+
+    python benchmarks/bench_client.py [--delay 0.005] [--field-size 65536] 2>/dev/null
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from ecmwf.opendata import Client
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+from server import OpenDataServer  # noqa: E402
+
+PARAMS = ["2t", "msl", "10u", "10v", "tp", "sp", "tcwv", "skt", "ro", "ssrd"]
+LEVELS = [1000, 925, 850, 700, 500]
+FIELDS = [{"param": p} for p in PARAMS] + [
+    {"param": p, "levelist": level} for p in ("t", "z") for level in LEVELS
+]
+
+# Name: (steps, params), the params are not contiguous in the data files,
+# so that each file needs several ranges
+SIZES = {
+    "small": ([0], ["2t"]),
+    "medium": (list(range(0, 30, 3)), ["2t", "10u", "tp", "tcwv"]),
+    "large": (list(range(0, 120, 3)), PARAMS[::2] + ["t"]),
+}
+
+MONTHS = [1, 2, 3, 4, 5, 6]
+
+
+def timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.005)
+    parser.add_argument("--field-size", type=int, default=64 * 1024)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    # The latest run of the server, so that latest() finds it
+    date = datetime.date.today() - datetime.timedelta(days=1)
+    date = int(date.strftime("%Y%m%d"))
+
+    server = OpenDataServer(delay=args.delay)
+    with server, tempfile.TemporaryDirectory() as tmp:
+        for step in range(0, 120, 3):
+            server.add_file(date, 0, step, FIELDS, length=args.field_size)
+        monthly = [{"type": "fcmean", "param": p} for p in PARAMS]
+        for month in MONTHS:
+            server.add_file(
+                date, 0, month, monthly, stream="mmsf", length=args.field_size
+            )
+
+        client = Client(
+            server.url,
+            concurrency=args.concurrency,
+            latest_cache=False,
+            source_accept_ranges=True,
+        )
+        target = os.path.join(tmp, "data")
+
+        def run(name, label, size, func, multiple_ranges=True):
+            server.accept_multiple_ranges = multiple_ranges
+            # Count the requests of one call, after a first one to warm up
+            func()
+            server.reset()
+            func()
+            requests = sum(len(paths) for paths in server.requests.values())
+
+            elapsed = timeit(func, args.repeat)
+            mib = size / 1024 / 1024
+            print(
+                f"{name:<18} {label:<8} {requests:>8} {mib:>9.1f}"
+                f" {elapsed * 1000:>10.1f} {mib / elapsed:>9.1f}"
+            )
+
+        print(
+            f"{args.delay * 1000:.1f}ms per request, {args.field_size} bytes per field"
+        )
+        print()
+        print(f"{'':<18} {'':<8} {'requests':>8} {'MiB':>9} {'ms':>10} {'MiB/s':>9}")
+
+        for label, (steps, params) in SIZES.items():
+            request = dict(date=date, time=0, step=steps, param=params, target=target)
+            data_urls = client._get_urls(request, use_index=False)
+            index_size = sum(
+                len(server.files[url[len(server.url) :].replace(".grib2", ".index")])
+                for url in data_urls.urls
+            )
+            retrieved = client.retrieve(request).size
+            downloaded = client.download(request).size
+
+            def get_parts():
+                client.get_parts(data_urls.urls, data_urls.for_index)
+
+            def latest():
+                client.latest(step=steps, param=params)
+
+            def retrieve():
+                client.retrieve(request)
+
+            def download():
+                client.download(request)
+
+            run("retrieve", label, retrieved, retrieve)
+            run("retrieve (single)", label, retrieved, retrieve, False)
+            run("download", label, downloaded, download)
+            run("get_parts", label, index_size, get_parts)
+            run("latest", label, 0, latest)
+
+        request = dict(
+            date=date,
+            time=0,
+            stream="mmsa",
+            type="fcmean",
+            fcmonth=MONTHS,
+            param=PARAMS[::3],
+            target=target,
+        )
+        retrieved = client.retrieve(request).size
+        run("retrieve", "monthly", retrieved, lambda: client.retrieve(request))
+        run(
+            "retrieve (single)",
+            "monthly",
+            retrieved,
+            lambda: client.retrieve(request),
+            False,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+"""
+Compare the per-line index matching that Client.get_parts used to do
+with ecmwf.opendata.index.Index on a synthetic enfo-like index.
+
+    python benchmarks/bench_index.py [--lines 50000]
+"""
+
+import argparse
+import json
+import pickle
+import time
+
+from ecmwf.opendata.index import Index
+
+PARAMS = ["t", "u", "v", "z", "q", "r", "w", "d", "vo", "gh"]
+LEVELS = ["1000", "925", "850", "700", "600", "500", "400", "300", "250", "200"]
+
+
+def synthetic_index(size):
+    lines = []
+    offset = 0
+    number = 0
+    while len(lines) < size:
+        for param in PARAMS:
+            for level in LEVELS:
+                length = 500_000 + 37 * len(lines)
+                lines.append(
+                    json.dumps(
+                        dict(
+                            domain="g",
+                            date="20260101",
+                            time="0000",
+                            expver="0001",
+                            type="pf",
+                            stream="enfo",
+                            step="24",
+                            levtype="pl",
+                            levelist=level,
+                            number=str(number),
+                            param=param,
+                            _offset=offset,
+                            _length=length,
+                        )
+                    ).encode()
+                )
+                offset += length
+        number += 1
+    return lines[:size]
+
+
+def legacy(lines, for_index, preserve_request_order):
+    count = len(for_index)
+    parts = []
+    for line in lines:
+        line = json.loads(line)
+        matches = []
+        for i, (name, values) in enumerate(for_index.items()):
+            idx = line.get(name)
+            if idx in values:
+                if preserve_request_order:
+                    for j, v in enumerate(values):
+                        if v == idx:
+                            matches.append((i, j))
+                else:
+                    matches.append(line["_offset"])
+        if len(matches) == count:
+            parts.append((tuple(matches), (line["_offset"], line["_length"])))
+    return [p[1] for p in sorted(parts)]
+
+
+def timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = synthetic_index(args.lines)
+
+    requests = {
+        "one field": {"param": ["t"], "levelist": ["500"], "number": ["10"]},
+        "one param": {"param": ["t"]},
+        "levels": {"param": ["t", "u", "v"], "levelist": LEVELS[::-1]},
+        "members": {"number": [str(n) for n in range(0, 500, 2)]},
+    }
+
+    print(f"{len(lines)} index lines")
+    print()
+    print("legacy: json.loads and match every line (the old Client.get_parts loop)")
+    print("cold:   Index.from_lines and match, as for a freshly downloaded index")
+    print("warm:   match only, as for an index loaded from the cache")
+    print()
+    print(
+        f"{'request':<10} {'order':<6} {'legacy':>9} {'cold':>9} {'warm':>9}"
+        f" {'cold':>6} {'warm':>7}"
+    )
+
+    for name, for_index in requests.items():
+        for preserve_request_order in (False, True):
+            old, expected = timeit(
+                lambda: legacy(lines, for_index, preserve_request_order), args.repeat
+            )
+            cold, result = timeit(
+                lambda: Index.from_lines(lines).match(
+                    for_index, preserve_request_order
+                ),
+                args.repeat,
+            )
+            assert result == expected, name
+
+            index = pickle.loads(pickle.dumps(Index.from_lines(lines)))
+            warm, result = timeit(
+                lambda: index.match(for_index, preserve_request_order), args.repeat
+            )
+            assert result == expected, name
+
+            print(
+                f"{name:<10} {str(preserve_request_order):<6}"
+                f" {old * 1000:>7.1f}ms {cold * 1000:>7.1f}ms {warm * 1000:>7.2f}ms"
+                f" {old / cold:>5.1f}x {old / warm:>6.0f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+"""
+Measure the throughput of backfill planning:
+
+- request preparation: the same few requests are prepared for every date
+  and time, so all but the first ones are served by the cache of
+  prepared requests;
+- URL planning: the data URLs of a single request covering every step
+  of four runs a day over the whole period.
+
+    python benchmarks/bench_plan.py [--days 90]
+"""
+
+import argparse
+import datetime
+import logging
+import time
+
+from ecmwf.opendata import Client
+
+REQUESTS = {
+    "oper": dict(type="fc", step=list(range(0, 145, 3)), param=["2t", "msl"]),
+    "enfo": dict(
+        stream="enfo",
+        type=["cf", "pf"],
+        step=list(range(0, 361, 6)),
+        param=["t", "z"],
+        levelist=[500, 850],
+        number=list(range(1, 51)),
+    ),
+    "wave": dict(stream="wave", type="fc", step="0/to/144/by/3", param="swh"),
+}
+
+
+def backfill(days):
+    start = datetime.date(2026, 6, 1)
+    for day in range(days):
+        for time_ in (0, 6, 12, 18):
+            for name, request in REQUESTS.items():
+                yield name, dict(
+                    request, date=start + datetime.timedelta(days=day), time=time_
+                )
+
+
+def timeit(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Do not report the requests before IFS Cycle 50r1
+    logging.disable(logging.WARNING)
+
+    client = Client(infer_stream_keyword=True)
+    requests = list(backfill(args.days))
+
+    def uncached():
+        for _, request in requests:
+            client._prepare_request(dict(request))
+
+    def cached():
+        client._prepared_requests.cache_clear()
+        for _, request in requests:
+            client.prepare_request(request)
+
+    def repeated():
+        for _, request in requests:
+            client.prepare_request(request)
+
+    print(f"{len(requests)} requests ({args.days} days x 4 times x {len(REQUESTS)})")
+    print()
+    print("uncached: prepare every request")
+    print("cached:   prepare_request() with an empty cache")
+    print("repeated: prepare_request() with every request already cached")
+    print()
+
+    for name, func in (
+        ("uncached", uncached),
+        ("cached", cached),
+        ("repeated", repeated),
+    ):
+        elapsed = timeit(func, args.repeat)
+        rate = len(requests) / elapsed
+        print(f"{name:<9} {elapsed * 1000:>8.1f}ms {rate:>10.0f} requests/s")
+
+    start = datetime.date(2026, 6, 1)
+    end = start + datetime.timedelta(days=args.days - 1)
+    request = dict(
+        date=f"{start:%Y%m%d}/to/{end:%Y%m%d}",
+        time=[0, 6, 12, 18],
+        step=list(range(0, 145)),
+        param="2t",
+    )
+    urls = len(client._get_urls(request, use_index=False).urls)
+    elapsed = timeit(lambda: client._get_urls(request, use_index=False), args.repeat)
+
+    print()
+    print(f"URL planning ({args.days} days x 4 times x 145 steps)")
+    print()
+    print(f"{'urls':<9} {elapsed * 1000:>8.1f}ms {urls / elapsed:>10.0f} urls/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,20 @@
 #
 
 
+from .aio import AsyncClient
 from .client import Client
+from .metrics import Metrics, PrometheusMetrics
+from .retry import CircuitBreaker, RetryPolicy
+from .stats import Hooks
 
 __version__ = "0.3.31"
 
-__all__ = ["Client"]
+__all__ = [
+    "AsyncClient",
+    "CircuitBreaker",
+    "Client",
+    "Hooks",
+    "Metrics",
+    "PrometheusMetrics",
+    "RetryPolicy",
+]
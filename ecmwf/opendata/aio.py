@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+
+from .client import Client, Result
+from .index import Index
+from .ranges import ascending_runs, coalesce, multi_range_requests
+from .utils import _show_attribution_message
+
+LOG = logging.getLogger(__name__)
+
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError(
+            "AsyncClient requires the 'aiohttp' package, "
+            "install it with: pip install ecmwf-opendata[async]"
+        ) from None
+    return aiohttp
+
+
+def _byteranges(data, content_type):
+    """Return the ``{offset: data}`` of the parts of a multipart/byteranges
+    response."""
+    boundary = content_type.split("boundary=", 1)[1].split(";")[0].strip('" ')
+    delimiter = b"--" + boundary.encode()
+    received = {}
+    position = data.find(delimiter)
+    while position >= 0 and not data.startswith(b"--", position + len(delimiter)):
+        start = data.index(b"\r\n\r\n", position) + 4
+        headers = data[position:start].decode("latin-1")
+        match = re.search(r"content-range:\s*bytes (\d+)-(\d+)/", headers, re.I)
+        if match is None:
+            raise ValueError("No Content-Range in a part of a multipart response")
+        first, last = int(match.group(1)), int(match.group(2))
+        end = start + last - first + 1
+        received[first] = data[start:end]
+        position = data.find(delimiter, end)
+    return received
+
+
+def _extract(received, url, offset, length):
+    for start, data in received.items():
+        if start <= offset and offset + length <= start + len(data):
+            return data[offset - start : offset - start + length]
+    raise ValueError(
+        "Expected bytes %s-%s from %s, got %s"
+        % (offset, offset + length - 1, url, sorted(received))
+    )
+
+
+class AsyncClient:
+    """An asyncio version of :class:`Client`.
+
+    Requests are prepared by a :class:`Client` created with the same
+    arguments, while `latest` probing, index fetching and range downloads
+    go through a single ``aiohttp`` session, so that connections are shared
+    between all the coroutines using this object. Failed requests are
+    retried with the `retry` policy and `circuit_breaker` of the client.
+    Use it as an async context manager, or call :meth:`close` when done.
+    """
+
+    def __init__(self, *args, **kwargs):
+        _aiohttp()
+        self.client = Client(*args, **kwargs)
+        self._session = None
+
+    @property
+    def url(self):
+        return self.client.url
+
+    @property
+    def session(self):
+        if self._session is None:
+            aiohttp = _aiohttp()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=max(self.client.concurrency, 1),
+                    limit_per_host=self.client.host_limiter.limit or 0,
+                    ssl=bool(self.client.verify),
+                    force_close=not self.client.keep_alive,
+                ),
+                raise_for_status=False,
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def _sign(self, url):
+        if self.client.use_sas_token:
+            return self.client._add_sas_to_url(url)
+        return url
+
+    async def _request(self, method, url, **kwargs):
+        """Issue a request, retrying according to the retry policy of the
+        client and checking its circuit breaker. The response must be
+        released by the caller."""
+        aiohttp = _aiohttp()
+        policy = self.client.retry
+        breaker = self.client.circuit_breaker
+        start = time.monotonic()
+        tries = 0
+        while True:
+            tries += 1
+            if breaker is not None:
+                breaker.check(url)
+
+            try:
+                response = await self.session.request(method, self._sign(url), **kwargs)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                response, error = None, e
+            else:
+                if response.status not in policy.statuses:
+                    if breaker is not None:
+                        breaker.success(url)
+                    return response
+                error = "%s %s" % (response.status, response.reason)
+
+            if breaker is not None:
+                breaker.failure(url)
+
+            delay = policy.delay(tries, response)
+            elapsed = time.monotonic() - start + delay
+            if tries >= policy.maximum_tries or (
+                policy.maximum_elapsed is not None and elapsed > policy.maximum_elapsed
+            ):
+                if response is None:
+                    raise error
+                return response
+
+            LOG.warning(
+                "Recovering from error [%s] on %s, attempt %s of %s, retry in %.1fs",
+                error,
+                url,
+                tries,
+                policy.maximum_tries,
+                delay,
+            )
+            if response is not None:
+                response.release()
+            await asyncio.sleep(delay)
+
+    async def _head_ok(self, url):
+        response = await self._request("HEAD", url)
+        response.release()
+        return response.status == 200
+
+    async def latest(self, request=None, **kwargs):
+        if request is None:
+            params = dict(**kwargs)
+        else:
+            params = dict(**request)
+
+        cache = self.client.latest_cache
+        if cache is not None:
+            key = self.client._latest_key(params)
+            date = cache.get(key)
+            if date is not None:
+                return date
+
+        probe = self.client._latest_probe(params)
+
+        for date in self.client._latest_dates(params):
+            result = self.client._get_urls(
+                request=None,
+                use_index=False,
+                date=date,
+                **probe,
+            )
+            if result.urls and all(
+                await asyncio.gather(*[self._head_ok(url) for url in result.urls])
+            ):
+                if cache is not None:
+                    cache.put(key, date, self.client._latest_delta(params))
+                return date
+
+        raise ValueError("Cannot establish latest date for %r" % (result.for_urls,))
+
+    async def _get_urls(self, request=None, target=None, **kwargs):
+        if request is None:
+            params = dict(**kwargs)
+        else:
+            params = dict(**request)
+
+        if "date" not in params:
+            params["date"] = await self.latest(params)
+
+        return self.client._get_urls(params, use_index=False, target=target)
+
+    async def get_index(self, url):
+        cache = self.client.index_cache
+        index_url = self.client.index_url(url)
+
+        if cache is not None:
+            index = cache.get(index_url)
+            if index is not None:
+                return index
+
+        response = await self._request("GET", index_url)
+        async with response:
+            response.raise_for_status()
+            lines = [line async for line in response.content]
+        index = Index.from_lines(line.strip() for line in lines)
+
+        if cache is not None:
+            cache.put(index_url, index)
+
+        return index
+
+    async def get_parts(self, data_urls, for_index):
+        semaphore = asyncio.Semaphore(max(self.client.concurrency, 1))
+
+        async def get_index(url):
+            async with semaphore:
+                return await self.get_index(url)
+
+        indexes = await asyncio.gather(*[get_index(url) for url in data_urls])
+        return list(self.client.match_indexes(data_urls, indexes, for_index))
+
+    async def _get_block(self, url, offset, length):
+        headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+        response = await self._request("GET", url, headers=headers)
+        async with response:
+            response.raise_for_status()
+            data = await response.read()
+
+        if response.status == 200:
+            # The server ignored the range and sent the whole file
+            data = data[offset : offset + length]
+
+        if len(data) != length:
+            raise ValueError(
+                "Expected %s bytes from %s, got %s" % (length, url, len(data))
+            )
+        return data
+
+    async def _get_blocks(self, url, blocks):
+        """Download `blocks` of `url` with a single multi-range request,
+        and return their data."""
+        if len(blocks) == 1:
+            return [await self._get_block(url, *blocks[0])]
+
+        ranges = ",".join(
+            f"{offset}-{offset + length - 1}" for offset, length in blocks
+        )
+        response = await self._request("GET", url, headers={"Range": f"bytes={ranges}"})
+        async with response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "")
+            data = await response.read()
+
+        if response.status == 200:
+            # The server ignored the ranges and sent the whole file
+            received = {0: data}
+        elif content_type.startswith("multipart/byteranges"):
+            received = _byteranges(data, content_type)
+        else:
+            LOG.debug("%s: multiple ranges not supported, sending them one by one", url)
+            return await asyncio.gather(
+                *[self._get_block(url, offset, length) for offset, length in blocks]
+            )
+
+        return [_extract(received, url, offset, length) for offset, length in blocks]
+
+    def _requests(self, parts):
+        # Split each file into blocks, each with the fields it contains, and
+        # group the blocks into the requests that fetch them
+        source = self.client.source
+        for url, ranges in parts:
+            for run in ascending_runs(ranges):
+                fields = deque(run)
+                blocks = coalesce(run, source.range_gap)
+                if source.accept_multiple_ranges is False:
+                    requests = [[block] for block in blocks]
+                else:
+                    requests = multi_range_requests(blocks)
+                for request in requests:
+                    inside = []
+                    for offset, length in request:
+                        inside.append([])
+                        while fields and fields[0][0] < offset + length:
+                            inside[-1].append(fields.popleft())
+                    yield url, request, inside
+
+    async def _download_parts(self, parts, f):
+        window = max(self.client.concurrency, 1) * 2
+        pending = deque()
+        total = 0
+
+        async def write():
+            nonlocal total
+            blocks, fields, task = pending.popleft()
+            for (offset, _), inside, data in zip(blocks, fields, await task):
+                for start, length in inside:
+                    f.write(data[start - offset : start - offset + length])
+                    total += length
+
+        try:
+            for url, blocks, fields in self._requests(parts):
+                task = asyncio.ensure_future(self._get_blocks(url, blocks))
+                pending.append((blocks, fields, task))
+                if len(pending) >= window:
+                    await write()
+            while pending:
+                await write()
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+        return total
+
+    async def _download_files(self, urls, f):
+        total = 0
+        for url in urls:
+            response = await self._request("GET", url)
+            async with response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(1024 * 1024):
+                    f.write(chunk)
+                    total += len(chunk)
+        return total
+
+    async def _download(self, request=None, target=None, use_index=False, **kwargs):
+        result = await self._get_urls(request, target=target, **kwargs)
+
+        if use_index and result.for_index:
+            result.urls = await self.get_parts(result.urls, result.for_index)
+            result.plan = self.client._range_plan()
+            for url, parts in result.urls:
+                result.plan.add(url, parts)
+
+        with open(result.target, "wb") as f:
+            if result.plan is not None:
+                result.size = await self._download_parts(result.urls, f)
+            else:
+                result.size = await self._download_files(result.urls, f)
+
+        _show_attribution_message()
+        return result
+
+    async def retrieve(self, request=None, target=None, **kwargs) -> Result:
+        return await self._download(request, target=target, use_index=True, **kwargs)
+
+    async def download(self, request=None, target=None, **kwargs) -> Result:
+        return await self._download(request, target=target, use_index=False, **kwargs)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+from multiurl.base import progress_bar
+
+from .client import RUN_COMPONENTS, Client, Result, _expand
+
+LOG = logging.getLogger(__name__)
+
+
+@dataclass
+class Run:
+    """Outcome of the retrieval of one forecast run by :func:`backfill`."""
+
+    date: str
+    time: Optional[str]
+    target: str
+    attempts: int = 0
+    result: Optional[Result] = None
+    error: Optional[BaseException] = None
+
+
+# The client of each worker process
+_client = None
+
+
+def _init_worker(options):
+    global _client
+    _client = Client(**options)
+
+
+def _retrieve(request, retries, retry_after):
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            return attempts, _client.retrieve(request)
+        except Exception as e:
+            if attempts > retries:
+                raise
+            LOG.warning(
+                "Retrieving %s/%s failed [%s], attempt %s of %s",
+                request["date"],
+                request.get("time"),
+                e,
+                attempts,
+                retries + 1,
+            )
+            time.sleep(retry_after)
+
+
+def runs(request, target):
+    """Split `request` into one request per date and time, each with its
+    own target, obtained by formatting `target` with ``date`` and ``time``.
+
+    The dates and times are expanded as :meth:`Client.prepare_request`
+    does, without creating a client in the calling process."""
+    request = dict(request)
+    request.pop("target", None)
+    if "date" not in request:
+        raise ValueError("A backfill request needs a date")
+
+    expanded = {
+        k: list(dict.fromkeys(_expand(k, request[k])))
+        for k in RUN_COMPONENTS
+        if k in request
+    }
+    times = expanded.get("time") or [None]
+
+    result = []
+    for date in expanded["date"]:
+        for time_ in times:
+            run = dict(request, date=date)
+            if time_ is not None:
+                run["time"] = time_
+            run["target"] = target.format(
+                date=date, time="" if time_ is None else "%02d" % int(time_)
+            )
+            result.append(run)
+    return result
+
+
+def backfill(
+    request,
+    target,
+    processes=4,
+    retries=2,
+    retry_after=10,
+    callback=None,
+    **options,
+):
+    """Retrieve a request covering many forecast runs, for instance
+    ``date="20260101/to/20260331"``, using a pool of `processes` processes.
+
+    Each run (date and time) is retrieved separately by a :class:`Client`
+    created with `options` in each process, into its own target: `target`
+    is formatted with the ``date`` (YYYYMMDD) and ``time`` (HH) of the
+    run, e.g. ``"data-{date}-{time}.grib2"``. A run that fails is retried
+    up to `retries` times, `retry_after` seconds apart.
+
+    Returns a :class:`Run` for each run, in order, with either the
+    :class:`Result` of the retrieval or the error that prevented it.
+    `callback` is called with each :class:`Run` as soon as it completes.
+    """
+    requests = runs(request, target)
+    if len(set(r["target"] for r in requests)) != len(requests):
+        raise ValueError("The target %r is the same for several runs" % (target,))
+
+    done = [
+        Run(date=r["date"], time=r.get("time"), target=r["target"]) for r in requests
+    ]
+
+    with progress_bar(total=None, desc="backfill") as pbar, ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(options,),
+    ) as executor:
+        futures = {
+            executor.submit(_retrieve, r, retries, retry_after): i
+            for i, r in enumerate(requests)
+        }
+        for n, future in enumerate(as_completed(futures), 1):
+            run = done[futures[future]]
+            try:
+                run.attempts, run.result = future.result()
+                pbar.update(run.result.size or 0)
+            except Exception as e:
+                run.attempts = retries + 1
+                run.error = e
+                LOG.error("Run %s %s failed: %s", run.date, run.time, e)
+            LOG.info("%s/%s runs done", n, len(requests))
+            if callback is not None:
+                callback(run)
+
+    return done
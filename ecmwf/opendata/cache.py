@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+CACHE_DIRECTORY = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "ecmwf-opendata",
+)
+
+# Bump when the layout of the cached objects changes
+INDEX_CACHE_VERSION = 3
+
+
+class DirectoryCache:
+    """Base class of the on-disk caches, one file per entry.
+
+    Entries older than `max_age` seconds are ignored, and the least
+    recently used entries are removed once the cache grows beyond
+    `max_size` bytes. As listing the directory is costly, this is only
+    checked after 1/16th of `max_size` has been written.
+    """
+
+    suffix = ".cache"
+    version = 1
+
+    def __init__(self, directory, max_size, max_age):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.written = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        key = hashlib.sha256(f"{self.version}:{key}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _read(self, key):
+        path = self._path(key)
+        try:
+            mtime = os.path.getmtime(path)
+            if self.max_age is not None and time.time() - mtime > self.max_age:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            # Record the access time for LRU eviction, keep the creation time
+            os.utime(path, (time.time(), mtime))
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _write(self, key, data):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+        with self.lock:
+            self.written += len(data)
+            evict = self.max_size is not None and self.written > self.max_size // 16
+            if evict:
+                self.written = 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if self.max_age is not None and now - stat.st_mtime > self.max_age:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if self.max_size is None or total <= self.max_size:
+                    break
+                self._remove(path)
+                total -= size
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                self._remove(os.path.join(self.directory, name))
+
+
+class IndexCache(DirectoryCache):
+    """On-disk cache of parsed ``.index`` files, keyed by index URL.
+
+    Forecast runs are immutable once published, so entries never need to
+    be revalidated against the server. Entries older than `max_age`
+    seconds are ignored, and the least recently used entries are
+    removed once the cache grows beyond `max_size` bytes.
+    """
+
+    suffix = ".pickle"
+    version = INDEX_CACHE_VERSION
+
+    def __init__(
+        self,
+        directory=None,
+        max_size=512 * 1024 * 1024,
+        max_age=7 * 24 * 3600,
+    ):
+        if directory is None:
+            directory = os.path.join(CACHE_DIRECTORY, "index")
+        super().__init__(directory, max_size, max_age)
+
+    def get(self, url):
+        try:
+            data = self._read(url)
+            if data is None:
+                return None
+            index = pickle.loads(data)
+        except Exception:
+            LOG.warning("Ignoring corrupted index cache entry %s", self._path(url))
+            return None
+
+        LOG.debug("Index cache hit for %s", url)
+        return index
+
+    def put(self, url, index):
+        self._write(url, pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class FieldCache(DirectoryCache):
+    """On-disk cache of the GRIB messages downloaded by byte ranges, keyed
+    by data URL, offset and length.
+
+    Published runs are immutable, so entries are never revalidated. The
+    least recently used entries are removed once the cache grows beyond
+    `max_size` bytes.
+    """
+
+    suffix = ".grib"
+
+    def __init__(self, directory=None, max_size=2 * 1024 * 1024 * 1024, max_age=None):
+        if directory is None:
+            directory = os.path.join(CACHE_DIRECTORY, "fields")
+        super().__init__(directory, max_size, max_age)
+
+    @staticmethod
+    def _key(url, offset, length):
+        # Ignore query strings, such as SAS tokens
+        return f"{url.split('?')[0]}:{offset}:{length}"
+
+    def get(self, url, offset, length):
+        data = self._read(self._key(url, offset, length))
+        if data is not None and len(data) != length:
+            LOG.warning("Ignoring corrupted field cache entry for %s", url)
+            return None
+        return data
+
+    def put(self, url, offset, length, data):
+        self._write(self._key(url, offset, length), data)
+
+
+class LatestCache:
+    """Cache of the results of :meth:`Client.latest`.
+
+    Runs start every 6 hours (every day when ``time`` is given) and are
+    only published hours later, so once the latest run is known, no newer
+    one can appear before the start of the next run plus
+    `publication_delay` seconds. After that, a result is still reused for
+    `ttl` seconds after it was established, to avoid probing the server on
+    every call.
+
+    If `path` is given, the cache is kept in that JSON file and shared
+    between processes.
+    """
+
+    def __init__(self, path=None, ttl=60, publication_delay=4 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.publication_delay = publication_delay
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def _load(self):
+        if self.path is None:
+            return self.entries
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            LOG.warning("Ignoring corrupted latest cache %s", self.path)
+            return {}
+
+    def _save(self, entries):
+        if self.path is None:
+            self.entries = entries
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def get(self, key):
+        with self.lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None
+        if datetime.datetime.utcnow() >= datetime.datetime.fromisoformat(
+            entry["expires"]
+        ):
+            return None
+        LOG.debug("Latest cache hit for %s", key)
+        return datetime.datetime.fromisoformat(entry["date"])
+
+    def put(self, key, date, delta):
+        now = datetime.datetime.utcnow()
+        expires = max(
+            date + delta + datetime.timedelta(seconds=self.publication_delay),
+            now + datetime.timedelta(seconds=self.ttl),
+        )
+        with self.lock:
+            entries = self._load()
+            # Drop the expired entries so the cache does not grow forever
+            entries = {
+                k: v
+                for k, v in entries.items()
+                if datetime.datetime.fromisoformat(v["expires"]) > now
+            }
+            entries[key] = dict(date=date.isoformat(), expires=expires.isoformat())
+            self._save(entries)
+
+
+def latest_cache_factory(latest_cache):
+    if latest_cache is None or latest_cache is False:
+        return None
+    if latest_cache is True:
+        return LatestCache()
+    if isinstance(latest_cache, (str, os.PathLike)):
+        return LatestCache(path=latest_cache)
+    return latest_cache
+
+
+def index_cache_factory(index_cache):
+    if index_cache is None or index_cache is False:
+        return None
+    if index_cache is True:
+        return IndexCache()
+    if isinstance(index_cache, (str, os.PathLike)):
+        return IndexCache(directory=index_cache)
+    return index_cache
+
+
+def field_cache_factory(field_cache):
+    if field_cache is None or field_cache is False:
+        return None
+    if field_cache is True:
+        return FieldCache()
+    if isinstance(field_cache, (str, os.PathLike)):
+        return FieldCache(directory=field_cache)
+    return field_cache
@@ -9,16 +9,23 @@
 #
 
 import datetime
+import functools
 import itertools
 import json
 import logging
 import os
+import shutil
+import tempfile
+import time
 from collections import defaultdict
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
 
 import requests
-from multiurl import download, robust
+from multiurl import download
+from requests.adapters import HTTPAdapter
 
+from .cache import field_cache_factory, index_cache_factory, latest_cache_factory
 from .date import (
     canonical_time,
     end_step,
@@ -27,7 +34,26 @@ from .date import (
     expand_time,
     full_date,
 )
+from .download import (
+    HostLimiter,
+    Journal,
+    buffer_download,
+    download_to_directory,
+    parallel_download,
+    pipelined_download,
+    stream_fields,
+)
+from .index import Index
+from .metrics import MetricsHooks
+from .ranges import RangeMethod, RangePlan, split_parts
+from .retry import circuit_breaker_factory, retry_factory, retrying
 from .sources import source_factory
+from .stats import MultipleHooks, TimedIterator
+from .stats import add_cache as record_cache
+from .stats import add_phase as record_phase
+from .stats import add_probe as record_probe
+from .stats import add_transfer as record_transfer
+from .stats import collect, in_context, instrument, phase
 from .utils import _show_attribution_message, warning_once
 
 LOG = logging.getLogger(__name__)
@@ -42,9 +68,190 @@ MONTHLY_PATTERN = (
     "{_yyyymmddHHMMSS}-{fcmonth}m-{_stream}-{type}.{_extension}"
 )
 
-PATTERNS = {"mmsa": MONTHLY_PATTERN}
+# Keyed by the stream of the URLs, "mmsa" requests are under "mmsf"
+PATTERNS = {"mmsf": MONTHLY_PATTERN}
 EXTENSIONS = {"tf": "bufr"}
 
+DEFAULTS_FC = dict(
+    type="fc",
+    stream="oper",
+    step=0,
+    fcmonth=1,
+)
+
+DEFAULTS_EF = dict(
+    type=["cf", "pf"],
+    stream="enfo",
+    step=0,
+    fcmonth=1,
+)
+
+DEFAULTS = {
+    "enfo": DEFAULTS_EF,
+    "waef": DEFAULTS_EF,
+}
+
+URL_COMPONENTS = (
+    "date",
+    "time",
+    "model",
+    "resol",
+    "stream",
+    "type",  # Must be before 'step' in that list
+    "step",
+    "fcmonth",
+)
+
+INDEX_COMPONENTS = (
+    "param",
+    "type",
+    "step",
+    "fcmonth",
+    "number",
+    "levelist",
+    "levtype",
+)
+
+# Handled separately from the cached part of the requests
+RUN_COMPONENTS = ("date", "time")
+
+# Order in which the keywords of a request are processed, URL components first
+SORT_ORDER = {
+    **{k: i + len(URL_COMPONENTS) for i, k in enumerate(INDEX_COMPONENTS)},
+    **{k: i for i, k in enumerate(URL_COMPONENTS)},
+}
+
+CANONICAL = {
+    "time": lambda x: str(canonical_time(x)),
+    # "param": lambda x: str(x).lower(),
+    # "type": lambda x: str(x).lower(),
+    # "stream": lambda x: str(x).lower(),
+}
+
+EXPAND_LIST = {
+    "date": expand_date,
+    "time": expand_time,
+}
+
+OTHER_STEP = {"mmsa": "step"}
+
+POSPROCESSING = {
+    "area",
+    "grid",
+    "rotation",
+    "frame",
+    "bitmap",
+    "gaussian",
+    "accuracy",
+    "format",
+}
+
+POSSIBLE_VALUES = {
+    "type": ["tf", "fc", "fcmean", "cf", "pf", "em", "ep", "es"],
+    "stream": ["oper", "wave", "scda", "scwv", "enfo", "waef", "mmsa"],
+}
+
+FOR_INDEX = {
+    ("type", "ef"): ["cf", "pf"],
+}
+
+FOR_URL = {
+    ("type", "cf"): "ef",
+    ("type", "pf"): "ef",
+    ("type", "em"): "ep",
+    ("type", "es"): "ep",
+    ("type", "fcmean"): "fc",
+    ("stream", "mmsa"): "mmsf",
+}
+
+# aifs-ens does not currently use ef, so the type is kept as pf/cf
+FOR_URL_AIFS_ENS = {
+    **FOR_URL,
+    ("type", "pf"): "pf",
+    ("type", "cf"): "cf",
+}
+
+
+def _sort_key(item):
+    return SORT_ORDER.get(item[0], len(URL_COMPONENTS) + len(INDEX_COMPONENTS))
+
+
+# As of IFS Cycle 50r1 (operational from 2026-05-12), the 06/18 UTC runs are
+# archived under stream=oper/wave rather than stream=scda/scwv.
+IFS_50R1_DATE = datetime.datetime(2026, 5, 12)
+
+URL_STREAM_MAPPING_50R1 = {
+    ("oper", "ef"): "enfo",
+    ("wave", "ef"): "waef",
+    ("oper", "ep"): "enfo",
+    ("wave", "ep"): "waef",
+}
+
+URL_STREAM_MAPPING_LEGACY = {
+    ("oper", "06"): "scda",
+    ("oper", "18"): "scda",
+    ("wave", "06"): "scwv",
+    ("wave", "18"): "scwv",
+    #
+    ("oper", "ef"): "enfo",
+    ("wave", "ef"): "waef",
+    ("oper", "ep"): "enfo",
+    ("wave", "ep"): "waef",
+    ("scda", "ef"): "enfo",
+    ("scwv", "ef"): "waef",
+    ("scda", "ep"): "enfo",
+    ("scwv", "ep"): "waef",
+}
+
+# Number of prepared requests kept by each client
+PREPARED_REQUESTS_CACHE_SIZE = 1024
+
+# Same as requests
+DEFAULT_POOL_SIZE = 10
+
+
+def _expand(key, value):
+    # List of the canonical forms of the values of a keyword
+    if isinstance(value, str):
+        value = value.split("/")
+
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+
+    value = EXPAND_LIST.get(key, expand_list)(value)
+
+    return [CANONICAL.get(key, str)(x) for x in value]
+
+
+def _freeze(params):
+    # Hashable version of a request, lists become tuples
+    return tuple(
+        (k, tuple(v) if isinstance(v, list) else v) for k, v in sorted(params.items())
+    )
+
+
+def _collecting(method):
+    # Record the statistics of a call that does not return a result
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        with collect(self.hooks):
+            return method(self, *args, **kwargs)
+
+    return wrapped
+
+
+def _with_stats(method):
+    # Record the statistics of a call on the returned result(s)
+    @functools.wraps(method)
+    def wrapped(self, *args, **kwargs):
+        with collect(self.hooks) as stats:
+            result = method(self, *args, **kwargs)
+            for r in result if isinstance(result, list) else [result]:
+                r.stats = stats
+        return result
+
+    return wrapped
+
 
 class Result:
     def __init__(self, urls, target, dates, for_urls, for_index):
@@ -57,6 +264,10 @@ class Result:
         self.for_urls = for_urls
         self.for_index = for_index
         self.size = None
+        self.plan = None
+        self.buffer = None
+        self.fields = None
+        self.stats = None
 
 
 class Client:
@@ -75,19 +286,69 @@ class Client:
         sas_custom_url=None,
         source_accept_ranges=None,
         source_accept_multiple_ranges=None,
+        source_range_gap=None,
+        concurrency=8,
+        index_cache=None,
+        download_concurrency=1,
+        max_connections_per_host=None,
+        latest_cache=True,
+        latest_check_all=False,
+        resume_transfers=False,
+        field_cache=None,
+        hooks=None,
+        metrics=None,
+        pool_connections=None,
+        pool_maxsize=None,
+        keep_alive=True,
+        transport=None,
+        retry=None,
+        circuit_breaker=None,
     ):
         self.source = source_factory(
             name=source,
             accept_ranges=source_accept_ranges,
             accept_multiple_ranges=source_accept_multiple_ranges,
+            range_gap=source_range_gap,
         )
         self.model = model
         self.resol = resol
         self.beta = beta
         self.preserve_request_order = preserve_request_order
         self.infer_stream_keyword = infer_stream_keyword
-        self.session = requests.Session()
         self.verify = verify
+        self.concurrency = concurrency
+        self.index_cache = index_cache_factory(index_cache)
+        self.download_concurrency = download_concurrency
+        self.transport = self._transport(
+            transport,
+            pool_connections,
+            pool_maxsize,
+            max_connections_per_host,
+        )
+        self.retry = retry_factory(retry)
+        self.circuit_breaker = circuit_breaker_factory(circuit_breaker)
+        self.session = instrument(requests.Session(), self.retry.statuses)
+        retrying(self.session, self.retry, self.circuit_breaker)
+        self.session.mount("https://", self.transport)
+        self.session.mount("http://", self.transport)
+        self.keep_alive = keep_alive
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+        self.host_limiter = HostLimiter(max_connections_per_host)
+        self.latest_cache = latest_cache_factory(latest_cache)
+        self.latest_check_all = latest_check_all
+        self.resume_transfers = resume_transfers
+        self.field_cache = field_cache_factory(field_cache)
+        if metrics is not None:
+            if hooks is None:
+                hooks = MetricsHooks(metrics)
+            else:
+                hooks = MultipleHooks(hooks, MetricsHooks(metrics))
+        self.hooks = hooks
+        self.metrics = metrics
+        self._prepared_requests = functools.lru_cache(PREPARED_REQUESTS_CACHE_SIZE)(
+            self._prepare_cached_request
+        )
 
         if source == "ecmwf":
             warning_once(
@@ -122,31 +383,118 @@ class Client:
             self.session.get = self._get_with_sas
             self.session.head = self._head_with_sas
 
+    def _transport(self, transport, pool_connections, pool_maxsize, max_per_host):
+        if transport is not None:
+            if pool_connections is not None or pool_maxsize is not None:
+                raise ValueError("The pool of a shared transport cannot be changed")
+            return transport
+
+        if pool_maxsize is None:
+            # Enough connections for all the threads that can be using the
+            # same host, so that none is closed after use
+            pool_maxsize = max_per_host or self.concurrency + self.download_concurrency
+            pool_maxsize = max(pool_maxsize, DEFAULT_POOL_SIZE)
+
+        return HTTPAdapter(
+            pool_connections=pool_connections or DEFAULT_POOL_SIZE,
+            pool_maxsize=pool_maxsize,
+        )
+
     @property
     def url(self):
         return self.source.url
 
+    @_with_stats
     def _download(
         self,
         request: Optional[dict] = None,
         target: Optional[str] = None,
         use_index: bool = False,
+        shard: Optional[Tuple[int, int]] = None,
         **kwargs,
     ) -> Result:
-        result = self._get_urls(request, target=target, use_index=use_index, **kwargs)
-        if self.use_sas_token:
-            result.urls = self._apply_sas_to_urls(result.urls)
+        result = self._get_urls(request, target=target, use_index=False, **kwargs)
+
+        if shard is not None and not result.for_index:
+            raise ValueError("Only requests using the index files can be sharded")
+
+        options = self._transfer_options(bool(use_index and result.for_index))
+
+        if use_index and result.for_index:
+            # Start transferring data as soon as the first index is parsed
+            parts = self.iter_parts(result.urls, result.for_index)
+            if shard is not None:
+                index, count = shard
+                parts = split_parts(list(parts), count)[index]
+            result.urls = []
+            result.plan = self._range_plan()
+
+            def collect():
+                for item in parts:
+                    result.urls.append(item)
+                    result.plan.add(*item)
+                    if self.use_sas_token:
+                        item = self._apply_sas_to_urls([item])[0]
+                    yield item
+
+            urls = collect()
+        else:
+            if self.use_sas_token:
+                result.urls = self._apply_sas_to_urls(result.urls)
+            urls = result.urls
+
+        journal = Journal(result.target) if self.resume_transfers else None
+
+        if self.download_concurrency > 1:
+            result.size = parallel_download(
+                urls,
+                result.target,
+                workers=self.download_concurrency,
+                limiter=self.host_limiter,
+                journal=journal,
+                **options,
+            )
+        elif (use_index and result.for_index) or journal is not None:
+            result.size = pipelined_download(
+                urls, result.target, journal=journal, **options
+            )
+        else:
+            start = time.perf_counter()
+            with phase("transfer"):
+                result.size = download(urls, target=result.target, **options)
+            if result.size is None:
+                # multiurl does not return the size of several files
+                result.size = os.path.getsize(result.target)
+            record_transfer(self.url, result.size, time.perf_counter() - start)
+
+        if result.plan is not None:
+            LOG.debug("%s", result.plan)
+
+        _show_attribution_message()
+        return result
 
-        result.size = download(
-            result.urls,
-            target=result.target,
+    def _transfer_options(self, use_index):
+        options = dict(
             verify=self.verify,
             session=self.session,
             accept_ranges=self.source.accept_ranges,
             accept_multiple_ranges=self.source.accept_multiple_ranges,
+            # The session retries according to self.retry
+            maximum_retries=1,
+        )
+        if use_index:
+            if self.source.range_gap:
+                options["range_method"] = RangeMethod(self.source.range_gap)
+            if self.field_cache is not None:
+                options["field_cache"] = self.field_cache
+        return options
+
+    def _range_plan(self):
+        return RangePlan(
+            gap=self.source.range_gap,
+            accept_ranges=self.source.accept_ranges,
+            accept_multiple_ranges=self.source.accept_multiple_ranges,
         )
-        _show_attribution_message()
-        return result
 
     def retrieve(self, request=None, target=None, **kwargs):
         return self._download(request, target=target, use_index=True, **kwargs)
@@ -154,37 +502,378 @@ class Client:
     def download(self, request=None, target=None, **kwargs):
         return self._download(request, target=target, use_index=False, **kwargs)
 
-    def latest(self, request=None, **kwargs):
-        if request is None:
-            params = dict(**kwargs)
+    def retrieve_shard(
+        self, shard, shards, request=None, target=None, **kwargs
+    ) -> Result:
+        """Retrieve the part `shard` (from 0) of a request split into
+        `shards` parts of about the same size.
+
+        The split only depends on the request and the indexes, so the
+        shards can be retrieved independently, e.g. on different machines.
+        Use an explicit ``date``, so that all of them retrieve the same
+        run. Concatenating the targets of all the shards in order, for
+        instance with :meth:`merge_shards`, gives the target of
+        :meth:`retrieve`.
+        """
+        if not 0 <= shard < shards:
+            raise ValueError("Invalid shard %r of %r" % (shard, shards))
+
+        result = self._download(
+            request, target=target, use_index=True, shard=(shard, shards), **kwargs
+        )
+        if not os.path.exists(result.target):
+            # Nothing to download for this shard
+            open(result.target, "wb").close()
+        return result
+
+    @staticmethod
+    def merge_shards(targets, target):
+        """Concatenate the targets of :meth:`retrieve_shard`, in order."""
+        with open(target, "wb") as f:
+            for shard in targets:
+                with open(shard, "rb") as g:
+                    shutil.copyfileobj(g, f, 1024 * 1024)
+
+    @_collecting
+    def plan(self, request=None, **kwargs) -> RangePlan:
+        """Return the :class:`~ecmwf.opendata.ranges.RangePlan` of the files
+        and range requests needed to retrieve a request, and the number of
+        bytes to download, without downloading any data.
+
+        Only the index files are downloaded. When the request selects whole
+        files (see :meth:`download`), their size is obtained with HEAD
+        requests.
+        """
+        result = self._get_urls(request, use_index=False, **kwargs)
+        plan = self._range_plan()
+
+        if result.for_index:
+            for url, parts in self.iter_parts(result.urls, result.for_index):
+                plan.add(url, parts)
         else:
-            params = dict(**request)
+            sizes = self._imap(self._content_length, result.urls)
+            for url, size in zip(result.urls, sizes):
+                plan.add_file(url, size)
+
+        return plan
+
+    @_with_stats
+    def retrieve_many(self, requests) -> List[Result]:
+        """Retrieve a list of requests, each with its own ``target``.
+
+        The requests are planned together: each index file is downloaded
+        once, and each field once, even if it is requested several times.
+        All the data is fetched with the same connections and concurrency,
+        then the targets are written. Returns one :class:`Result` per
+        request.
+        """
+        results = [self._get_urls(request, use_index=False) for request in requests]
+        for result in results:
+            if result.target is None:
+                raise ValueError("No target for request %r" % (result.for_urls,))
+
+        index_urls = list(
+            dict.fromkeys(url for r in results if r.for_index for url in r.urls)
+        )
+        indexes = dict(zip(index_urls, self._imap(self.get_index, index_urls)))
+
+        # Union of the parts of each data file, or None for whole files
+        wanted = {}
+        for result in results:
+            if not result.for_index:
+                for url in result.urls:
+                    wanted[url] = None
+                continue
+
+            result.urls = list(
+                self.match_indexes(
+                    result.urls,
+                    [indexes[url] for url in result.urls],
+                    result.for_index,
+                )
+            )
+            result.plan = self._range_plan()
+            for url, parts in result.urls:
+                result.plan.add(url, parts)
+                if wanted.get(url, ()) is not None:
+                    wanted.setdefault(url, set()).update(parts)
+
+        items = []
+        for url, parts in wanted.items():
+            if self.use_sas_token:
+                url = self._add_sas_to_url(url)
+            items.append((url, None if parts is None else tuple(sorted(parts))))
+
+        # Stage the downloads next to the first target, as parallel_download
+        # does, rather than in a possibly small system temporary directory
+        staging = None
+        if results:
+            staging = os.path.dirname(os.path.abspath(results[0].target))
+        with tempfile.TemporaryDirectory(
+            prefix="ecmwf-opendata-", dir=staging
+        ) as directory:
+            paths = download_to_directory(
+                items,
+                directory,
+                workers=self.download_concurrency,
+                limiter=self.host_limiter,
+                **self._transfer_options(True),
+            )
+
+            # Where each part is in the downloaded files
+            files = {}
+            for url, (_, parts), path in zip(wanted, items, paths):
+                positions = None
+                if parts is not None:
+                    positions = {}
+                    position = 0
+                    for part in parts:
+                        positions[part] = position
+                        position += part[1]
+                files[url] = (path, positions)
+
+            for result in results:
+                result.size = self._assemble(result, files)
+
+        _show_attribution_message()
+        return results
+
+    def _assemble(self, result, files):
+        total = 0
+        with open(result.target, "wb") as f:
+            if not result.for_index:
+                for url in result.urls:
+                    with open(files[url][0], "rb") as data:
+                        shutil.copyfileobj(data, f, 1024 * 1024)
+                        total += data.tell()
+                return total
+
+            for url, parts in result.urls:
+                path, positions = files[url]
+                with open(path, "rb") as data:
+                    for offset, length in parts:
+                        if positions is not None:
+                            offset = positions[(offset, length)]
+                        data.seek(offset)
+                        f.write(data.read(length))
+                        total += length
+        return total
+
+    @_with_stats
+    def retrieve_buffer(self, request=None, **kwargs) -> Result:
+        """Like :meth:`retrieve`, but download the data into memory.
+
+        The size of the data is known from the indexes, so it is written
+        into a single preallocated buffer, available as ``result.buffer``.
+        ``result.fields`` lists ``(entry, view)`` for each field, where
+        `entry` is its index entry and `view` a memoryview of its GRIB
+        message within the buffer.
+        """
+        result = self._get_urls(request, use_index=False, **kwargs)
+        if not result.for_index:
+            raise ValueError(
+                "Only requests using the index files can be retrieved into memory"
+            )
+
+        options = self._transfer_options(True)
+
+        items = list(self.iter_parts(result.urls, result.for_index, entries=True))
+
+        size = sum(length for _, parts, _ in items for _, length in parts)
+        buffer = memoryview(bytearray(size))
+
+        result.urls = []
+        result.plan = self._range_plan()
+        result.fields = []
+        views = []
+        offset = 0
+        for url, parts, entries in items:
+            result.urls.append((url, parts))
+            result.plan.add(url, parts)
+            start = offset
+            for entry, (_, length) in zip(entries, parts):
+                result.fields.append((entry, buffer[offset : offset + length]))
+                offset += length
+            if self.use_sas_token:
+                url = self._add_sas_to_url(url)
+            views.append((url, parts, buffer[start:offset]))
+
+        result.size = buffer_download(
+            views,
+            workers=self.download_concurrency,
+            limiter=self.host_limiter,
+            **options,
+        )
+        result.buffer = buffer
+
+        _show_attribution_message()
+        return result
+
+    def stream(self, request=None, **kwargs):
+        """Yield ``(entry, data)`` for each field matching the request, where
+        `entry` is the index entry of the field (param, step, number,
+        levelist...) and `data` its GRIB message, as the data is received.
+
+        Nothing is written to disk, and only a few fields are held in
+        memory, however slowly the generator is consumed.
+        """
+        result = self._get_urls(request, use_index=False, **kwargs)
+        if not result.for_index:
+            raise ValueError("Only requests using the index files can be streamed")
 
+        options = self._transfer_options(True)
+
+        def fields():
+            for url, parts, entries in self.iter_parts(
+                result.urls, result.for_index, entries=True
+            ):
+                if self.use_sas_token:
+                    url = self._add_sas_to_url(url)
+                yield url, parts, entries
+
+        yield from stream_fields(fields(), limiter=self.host_limiter, **options)
+        _show_attribution_message()
+
+    def _latest_delta(self, params):
+        # Interval between the candidate runs of latest()
         if "time" not in params:
-            delta = datetime.timedelta(hours=6)
-        else:
-            delta = datetime.timedelta(days=1)
+            return datetime.timedelta(hours=6)
+        return datetime.timedelta(days=1)
+
+    def _latest_dates(self, params):
+        # Candidate dates for latest(), newest first
+        delta = self._latest_delta(params)
 
         date = full_date(0, params.get("time", 18))
 
         stop = date - datetime.timedelta(days=2)
 
+        dates = []
         while date > stop:
+            dates.append(date)
+            date -= delta
+        return dates
+
+    def _latest_key(self, params):
+        # The files probed by latest() for this request, whatever the date
+        params = dict(params)
+        params.pop("date", None)
+        for_urls, _ = self.prepare_request(params)
+        return json.dumps([self.source.url, self.beta, sorted(for_urls.items())])
+
+    def latest(self, request=None, **kwargs):
+        with collect(self.hooks), phase("latest"):
+            return self._latest(request, **kwargs)
+
+    def _latest(self, request=None, **kwargs):
+        if request is None:
+            params = dict(**kwargs)
+        else:
+            params = dict(**request)
+
+        if self.latest_cache is not None:
+            key = self._latest_key(params)
+            date = self.latest_cache.get(key)
+            record_cache("latest", date is not None)
+            if date is not None:
+                return date
+
+        probe = self._latest_probe(params)
+
+        candidates = []
+        for date in self._latest_dates(params):
             result = self._get_urls(
                 request=None,
                 use_index=False,
                 date=date,
-                **params,
+                **probe,
             )
-            codes = [
-                robust(self.session.head)(url, verify=self.verify).status_code
-                for url in result.urls
-            ]
-            if len(codes) > 0 and all(c == 200 for c in codes):
-                return date
-            date -= delta
-
-        raise ValueError("Cannot establish latest date for %r" % (result.for_urls,))
+            candidates.append((date, result.urls))
+
+        date = self._probe(candidates)
+        if date is None:
+            raise ValueError("Cannot establish latest date for %r" % (result.for_urls,))
+
+        if self.latest_cache is not None:
+            self.latest_cache.put(key, date, self._latest_delta(params))
+
+        return date
+
+    def _latest_probe(self, params):
+        # Steps are published in order, so unless asked to check all the
+        # files, only probe the last step (or month) of each run
+        if self.latest_check_all:
+            return params
+
+        probe = dict(params)
+        probe.pop("date", None)
+        for_urls, _ = self.prepare_request(probe)
+        for key in ("step", "fcmonth"):
+            if len(for_urls.get(key, [])) > 1:
+                probe[key] = max(for_urls[key], key=end_step)
+        return probe
+
+    def _head(self, url):
+        with self.host_limiter(url):
+            status = self.session.head(url, verify=self.verify).status_code
+        record_probe(url, status)
+        return status
+
+    def _content_length(self, url):
+        with self.host_limiter(url):
+            r = self.session.head(url, verify=self.verify)
+        r.raise_for_status()
+        return int(r.headers["content-length"])
+
+    def _probe(self, candidates):
+        """Return the first date of `candidates`, a list of ``(date, urls)``,
+        for which all the URLs exist, or None.
+
+        The URLs of all dates are probed concurrently, in order. A date is
+        abandoned at its first missing URL, and the probing stops as soon
+        as the first available date is known."""
+        status = [None if urls else False for _, urls in candidates]
+        remaining = [len(urls) for _, urls in candidates]
+
+        def first_available():
+            for ok, (date, _) in zip(status, candidates):
+                if ok is None:
+                    return None
+                if ok:
+                    return date
+            return None
+
+        with ThreadPoolExecutor(max_workers=max(self.concurrency, 1)) as executor:
+            futures = {}
+            submitted = []
+            head = in_context(self._head)
+            for i, (_, urls) in enumerate(candidates):
+                submitted.append([executor.submit(head, url) for url in urls])
+                futures.update((future, i) for future in submitted[-1])
+
+            try:
+                for future in as_completed(futures):
+                    i = futures[future]
+                    if future.cancelled() or status[i] is not None:
+                        continue
+
+                    if future.result() == 200:
+                        remaining[i] -= 1
+                        if remaining[i] == 0:
+                            status[i] = True
+                    else:
+                        status[i] = False
+                        for other in submitted[i]:
+                            other.cancel()
+
+                    date = first_available()
+                    if date is not None or all(ok is False for ok in status):
+                        return date
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        return first_available()
 
     def _get_urls(self, request=None, use_index=None, target=None, **kwargs):
         assert use_index in (True, False)
@@ -199,6 +888,15 @@ class Client:
         if target is None:
             target = params.pop("target", None)
 
+        with phase("urls"):
+            result = self._expand_urls(params, target)
+
+        if result.for_index and use_index:
+            result.urls = self.get_parts(result.urls, result.for_index)
+
+        return result
+
+    def _expand_urls(self, params, target):
         for_urls, for_index = self.prepare_request(params)
 
         for_urls["_url"] = [self.source.url]
@@ -208,17 +906,39 @@ class Client:
 
         dates = set()
 
+        # Components that only depend on the run, and the patched streams,
+        # are computed once and reused for all the steps, types, etc.
+        runs = {}
+        streams = {}
+
         for args in (
             dict(zip(for_urls.keys(), x)) for x in itertools.product(*for_urls.values())
         ):
             pattern = PATTERNS.get(args["stream"], HOURLY_PATTERN)
-            date = full_date(args.pop("date", None), args.pop("time", None))
-            dates.add(date)
-            args["_yyyymmdd"] = date.strftime("%Y%m%d")
-            args["_H"] = date.strftime("%H")
-            args["_yyyymmddHHMMSS"] = date.strftime("%Y%m%d%H%M%S")
+            run = (args.pop("date", None), args.pop("time", None))
+            components = runs.get(run)
+            if components is None:
+                date = full_date(*run)
+                dates.add(date)
+                components = runs[run] = dict(
+                    _yyyymmdd=date.strftime("%Y%m%d"),
+                    _H=date.strftime("%H"),
+                    _yyyymmddHHMMSS=date.strftime("%Y%m%d%H%M%S"),
+                )
+            args.update(components)
             args["_extension"] = EXTENSIONS.get(args["type"], "grib2")
-            args["_stream"] = self.patch_stream(args)
+
+            key = (
+                args["stream"],
+                args["type"],
+                args["model"],
+                args["_yyyymmdd"],
+                args["_H"],
+            )
+            stream = streams.get(key)
+            if stream is None:
+                stream = streams[key] = self.patch_stream(args)
+            args["_stream"] = stream
 
             if self.beta:
                 # test data is put in an /experimental subdir after resol
@@ -234,7 +954,6 @@ class Client:
                 data_urls.append(url)
                 seen.add(url)
 
-        IFS_50R1_DATE = datetime.datetime(2026, 5, 12)
         if any(d < IFS_50R1_DATE for d in dates):
             warning_once(
                 "Some requested dates are before 2026-05-12. Data before this date uses a "
@@ -244,9 +963,6 @@ class Client:
                 "the underlying file structure differs across this boundary."
             )
 
-        if for_index and use_index:
-            data_urls = self.get_parts(data_urls, for_index)
-
         return Result(
             urls=data_urls,
             target=target,
@@ -255,40 +971,79 @@ class Client:
             for_index=for_index,
         )
 
-    def get_parts(self, data_urls, for_index):
-        count = len(for_index)
-        result = []
-        line = None
+    def _imap(self, func, items):
+        # Like map(), but runs up to `concurrency` calls at once
+        items = list(items)
+        if self.concurrency <= 1 or len(items) <= 1:
+            yield from map(func, items)
+            return
+
+        with ThreadPoolExecutor(
+            max_workers=min(self.concurrency, len(items))
+        ) as executor:
+            yield from executor.map(in_context(func), items)
+
+    def index_url(self, url):
+        base, _ = os.path.splitext(url)
+        return f"{base}.index"
+
+    def get_index(self, url):
+        index_url = self.index_url(url)
+
+        if self.index_cache is not None:
+            index = self.index_cache.get(index_url)
+            record_cache("index", index is not None)
+            if index is not None:
+                return index
+
+        with self.host_limiter(index_url):
+            start = time.perf_counter()
+            # Stream the response, so lines are parsed while the rest is arriving
+            r = self.session.get(index_url, verify=self.verify, stream=True)
+            with r:
+                r.raise_for_status()
+                lines = TimedIterator(r.iter_lines())
+                waiting = time.perf_counter() - start
+                index = Index.from_lines(lines)
+                size = r.raw.tell()
+            elapsed = time.perf_counter() - start
+
+        # Split the time between waiting for the server and parsing the lines
+        waiting += lines.seconds
+        record_phase("index", waiting)
+        record_phase("parse", elapsed - waiting)
+        record_transfer(index_url, size, waiting)
+
+        if self.index_cache is not None:
+            self.index_cache.put(index_url, index)
+
+        return index
+
+    def iter_parts(self, data_urls, for_index, entries=False):
+        """Yield the ``(url, parts)`` of the data files matching `for_index`,
+        in the order of `data_urls`, as soon as their index is parsed. If
+        `entries` is set, yield ``(url, parts, entries)`` where `entries`
+        are the matching index entries."""
+        indexes = self._imap(self.get_index, data_urls)
+        return self.match_indexes(data_urls, indexes, for_index, entries)
+
+    def match_indexes(self, data_urls, indexes, for_index, entries=False):
+        found = False
 
         possible_values = defaultdict(set)
 
-        for url in data_urls:
-            base, _ = os.path.splitext(url)
-            index_url = f"{base}.index"
-            r = robust(self.session.get)(index_url, verify=self.verify)
-            r.raise_for_status()
-
-            parts = []
-            for line in r.iter_lines():
-                line = json.loads(line)
-                matches = []
-                for i, (name, values) in enumerate(for_index.items()):
-                    idx = line.get(name)
-                    if idx is not None:
-                        possible_values[name].add(idx)
-                    if idx in values:
-                        if self.preserve_request_order:
-                            for j, v in enumerate(values):
-                                if v == idx:
-                                    matches.append((i, j))
-                        else:
-                            matches.append(line["_offset"])
-
-                if len(matches) == count:
-                    parts.append((tuple(matches), (line["_offset"], line["_length"])))
-
-            if parts:
-                result.append((url, tuple(p[1] for p in sorted(parts))))
+        for url, index in zip(data_urls, indexes):
+            for name in for_index:
+                possible_values[name].update(index.possible_values(name))
+
+            rows = index.match_rows(for_index, self.preserve_request_order)
+            if rows:
+                found = True
+                parts = tuple((index.offsets[row], index.lengths[row]) for row in rows)
+                if entries:
+                    yield (url, parts, index.entries(rows))
+                else:
+                    yield (url, parts)
 
         for name, values in for_index.items():
             diff = set(values).difference(possible_values[name])
@@ -300,47 +1055,66 @@ class Client:
                     did_you_mean=(d, possible_values[name]),
                 )
 
-        if not result:
+        if not found:
             raise ValueError("Cannot find index entries matching %r" % (for_index,))
 
-        return result
+    @_collecting
+    def get_parts(self, data_urls, for_index):
+        return list(self.iter_parts(data_urls, for_index))
 
     def user_to_index(self, key, value, request, for_index):
-        FOR_INDEX = {
-            ("type", "ef"): ["cf", "pf"],
-        }
-
         return FOR_INDEX.get((key, value), value)
 
     def user_to_url(self, key, value, request, for_urls, model):
-        FOR_URL = {
-            ("type", "cf"): "ef",
-            ("type", "pf"): "ef",
-            ("type", "em"): "ep",
-            ("type", "es"): "ep",
-            ("type", "fcmean"): "fc",
-            ("stream", "mmsa"): "mmsf",
-        }
-
-        # If the model is aifs-ens, we need to map the type to pf/cf because aifs-ens does not currently use ef
-        if model == "aifs-ens":
-            FOR_URL[("type", "pf")] = "pf"
-            FOR_URL[("type", "cf")] = "cf"
-
         if key == "step" and for_urls["type"] == ["ep"]:
             if end_step(value) <= 240:
                 return "240"
             else:
                 return "360"
 
-        return FOR_URL.get((key, value), value)
+        # If the model is aifs-ens, we need to map the type to pf/cf because aifs-ens does not currently use ef
+        mapping = FOR_URL_AIFS_ENS if model == "aifs-ens" else FOR_URL
+        return mapping.get((key, value), value)
 
     def prepare_request(self, request=None, **kwargs):
+        """Split a request into the values used to build the data URLs and
+        the values to look up in the index files.
+
+        The date and time do not affect the other keywords, so the rest of
+        the request is prepared once and cached, as the same requests are
+        prepared for many runs, e.g. by :meth:`latest` and when planning
+        backfills.
+        """
         if request is None:
             params = dict(**kwargs)
         else:
             params = dict(**request)
 
+        run = {k: params.pop(k) for k in RUN_COMPONENTS if k in params}
+
+        try:
+            key = (_freeze(params), self.model, self.resol)
+            hash(key)
+        except TypeError:
+            return self._prepare_request(dict(params, **run))
+
+        for_urls, for_index = self._prepared_requests(key)
+
+        # The results are modified by the callers
+        for_run = {}
+        for k, v in run.items():
+            v = list(dict.fromkeys(_expand(k, v)))
+            if v:
+                for_run[k] = v
+        return (
+            {**for_run, **{k: list(v) for k, v in for_urls.items()}},
+            {k: list(v) for k, v in for_index.items()},
+        )
+
+    def _prepare_cached_request(self, key):
+        return self._prepare_request(dict(key[0]))
+
+    def _prepare_request(self, params):
         if "model" in params:
             # If model is in the retireve overwrite the client model
             # Warn user if client model does not match the model in retrieve
@@ -376,80 +1150,8 @@ class Client:
         if model == "aifs-ens":
             params["stream"] = "enfo"
 
-        DEFAULTS_FC = dict(
-            model=model,
-            resol=self.resol,
-            type="fc",
-            stream="oper",
-            step=0,
-            fcmonth=1,
-        )
-
-        DEFAULTS_EF = dict(
-            model=model,
-            resol=self.resol,
-            type=["cf", "pf"],
-            stream="enfo",
-            step=0,
-            fcmonth=1,
-        )
-
-        DEFAULTS = {
-            "enfo": DEFAULTS_EF,
-            "waef": DEFAULTS_EF,
-        }
-
-        URL_COMPONENTS = (
-            "date",
-            "time",
-            "model",
-            "resol",
-            "stream",
-            "type",  # Must be before 'step' in that list
-            "step",
-            "fcmonth",
-        )
-
-        INDEX_COMPONENTS = (
-            "param",
-            "type",
-            "step",
-            "fcmonth",
-            "number",
-            "levelist",
-            "levtype",
-        )
-
-        CANONICAL = {
-            "time": lambda x: str(canonical_time(x)),
-            # "param": lambda x: str(x).lower(),
-            # "type": lambda x: str(x).lower(),
-            # "stream": lambda x: str(x).lower(),
-        }
-
-        EXPAND_LIST = {
-            "date": expand_date,
-            "time": expand_time,
-        }
-
-        OTHER_STEP = {"mmsa": "step"}
-
-        POSPROCESSING = {
-            "area",
-            "grid",
-            "rotation",
-            "frame",
-            "bitmap",
-            "gaussian",
-            "accuracy",
-            "format",
-        }
-
-        POSSIBLE_VALUES = {
-            "type": ["tf", "fc", "fcmean", "cf", "pf", "em", "ep", "es"],
-            "stream": ["oper", "wave", "scda", "scwv", "enfo", "waef", "mmsa"],
-        }
-
+        params.setdefault("model", model)
+        params.setdefault("resol", self.resol)
         defaults = DEFAULTS.get(params.get("stream"), DEFAULTS_FC)
         for key, value in defaults.items():
             params.setdefault(key, value)
@@ -467,25 +1169,8 @@ class Client:
         for_index = defaultdict(list)
         ignored = set()
 
-        def sorter(kv):
-            a = kv[0]
-            if a in URL_COMPONENTS:
-                return URL_COMPONENTS.index(a)
-            if a in INDEX_COMPONENTS:
-                return INDEX_COMPONENTS.index(a) + len(URL_COMPONENTS)
-            return len(URL_COMPONENTS) + len(INDEX_COMPONENTS)
-
-        for k, v in sorted(params.items(), key=sorter):
-            if isinstance(v, str):
-                v = v.split("/")
-
-            if not isinstance(v, (list, tuple)):
-                v = [v]
-
-            v = EXPAND_LIST.get(k, expand_list)(v)
-
-            # Return canonical forms
-            v = [CANONICAL.get(k, str)(x) for x in v]
+        for k, v in sorted(params.items(), key=_sort_key):
+            v = _expand(k, v)
 
             if k.startswith("_"):
                 continue
@@ -502,22 +1187,26 @@ class Client:
                         )
 
             if k in INDEX_COMPONENTS:
-                for values in [self.user_to_index(k, x, params, for_index) for x in v]:
-                    if not isinstance(values, (list, tuple)):
-                        values = [values]
-                    for value in values:
-                        if value not in for_index[k]:
-                            for_index[k].append(value)
+                values = []
+                for x in v:
+                    value = self.user_to_index(k, x, params, for_index)
+                    if isinstance(value, (list, tuple)):
+                        values.extend(value)
+                    else:
+                        values.append(value)
+                if values:
+                    for_index[k] = list(dict.fromkeys(values))
 
             if k in URL_COMPONENTS:
-                for values in [
-                    self.user_to_url(k, x, params, for_urls, model) for x in v
-                ]:
-                    if not isinstance(values, (list, tuple)):
-                        values = [values]
-                    for value in values:
-                        if value not in for_urls[k]:
-                            for_urls[k].append(value)
+                values = []
+                for x in v:
+                    value = self.user_to_url(k, x, params, for_urls, model)
+                    if isinstance(value, (list, tuple)):
+                        values.extend(value)
+                    else:
+                        values.append(value)
+                if values:
+                    for_urls[k] = list(dict.fromkeys(values))
 
             if (
                 k not in URL_COMPONENTS
@@ -544,35 +1233,14 @@ class Client:
         # source="ecmwf-testdata" always uses the new structure.
         # All other sources use the new structure for dates >= 2026-05-12 and the
         # old structure for earlier dates, allowing requests that span the boundary.
-        IFS_50R1_DATE = datetime.date(2026, 5, 12)
-
-        request_date = datetime.datetime.strptime(args["_yyyymmdd"], "%Y%m%d").date()
+        request_date = datetime.datetime.strptime(args["_yyyymmdd"], "%Y%m%d")
 
         if self.source == "ecmwf-testdata" or request_date >= IFS_50R1_DATE:
             # New structure: 06/18 runs stay under oper/wave
-            URL_STREAM_MAPPING = {
-                ("oper", "ef"): "enfo",
-                ("wave", "ef"): "waef",
-                ("oper", "ep"): "enfo",
-                ("wave", "ep"): "waef",
-            }
+            URL_STREAM_MAPPING = URL_STREAM_MAPPING_50R1
         else:
             # Old structure: 06/18 runs mapped to scda/scwv
-            URL_STREAM_MAPPING = {
-                ("oper", "06"): "scda",
-                ("oper", "18"): "scda",
-                ("wave", "06"): "scwv",
-                ("wave", "18"): "scwv",
-                #
-                ("oper", "ef"): "enfo",
-                ("wave", "ef"): "waef",
-                ("oper", "ep"): "enfo",
-                ("wave", "ep"): "waef",
-                ("scda", "ef"): "enfo",
-                ("scwv", "ef"): "waef",
-                ("scda", "ep"): "enfo",
-                ("scwv", "ep"): "waef",
-            }
+            URL_STREAM_MAPPING = URL_STREAM_MAPPING_LEGACY
         stream, time, type = args["stream"], args["_H"], args["type"]
 
         if not self.infer_stream_keyword or args["model"] == "aifs-single":
@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from queue import Full, Queue
+from urllib.parse import urlparse
+
+from multiurl import Downloader
+from multiurl.base import progress_bar
+
+from .ranges import single_range_groups
+from .stats import add_cache, add_transfer, in_context, phase
+
+LOG = logging.getLogger(__name__)
+
+
+class HostLimiter:
+    """Limit the number of simultaneous requests to each host."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    @contextmanager
+    def __call__(self, url):
+        if not self.limit:
+            yield
+            return
+
+        host = urlparse(url).netloc
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = self.semaphores[host] = threading.BoundedSemaphore(
+                    self.limit
+                )
+        with semaphore:
+            yield
+
+
+def _url_and_parts(item):
+    if isinstance(item, (list, tuple)):
+        return item
+    return item, None
+
+
+class Journal:
+    """Sidecar file recording the elements of a download already written
+    to its target, so that an interrupted download can be resumed.
+
+    Elements are written to the target in order, so the journal is a list
+    of ``(url, parts, end)``, where `end` is the size of the target once
+    the element is written. On restart, the elements matching the start
+    of the journal are skipped, and the target is truncated after the last
+    of them.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.path = f"{target}.journal"
+        self.entries = []
+        self.position = 0
+        self.offset = 0
+        self.diverged = False
+        self.opened = False
+
+        try:
+            size = os.path.getsize(target)
+            with open(self.path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["end"] > size:
+                        break
+                    self.entries.append(entry)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            LOG.warning("Ignoring corrupted journal %s", self.path)
+
+    @staticmethod
+    def _key(url, parts):
+        # Ignore query strings, such as SAS tokens, that may change
+        return url.split("?")[0], None if parts is None else [list(p) for p in parts]
+
+    def skip(self, url, parts):
+        """Return True if the next element is already in the target."""
+        if self.diverged or self.position >= len(self.entries):
+            self.diverged = True
+            return False
+
+        entry = self.entries[self.position]
+        if (entry["url"], entry["parts"]) != self._key(url, parts):
+            self.diverged = True
+            return False
+
+        LOG.debug("Skipping %s, already downloaded", url)
+        self.position += 1
+        self.offset = entry["end"]
+        return True
+
+    def open(self):
+        """Open the target for writing after the skipped elements."""
+        self.diverged = True
+        self.opened = True
+        self.entries = self.entries[: self.position]
+        with open(self.path, "w") as f:
+            for entry in self.entries:
+                print(json.dumps(entry), file=f)
+
+        if self.offset:
+            LOG.info("%s: resuming download from byte %s", self.target, self.offset)
+            f = open(self.target, "r+b")
+            f.truncate(self.offset)
+            f.seek(self.offset)
+            return f
+        return open(self.target, "wb")
+
+    def record(self, url, parts, f):
+        f.flush()
+        os.fsync(f.fileno())
+        url, parts = self._key(url, parts)
+        entry = dict(url=url, parts=parts, end=f.tell())
+        with open(self.path, "a") as j:
+            print(json.dumps(entry), file=j)
+
+    def close(self):
+        if not self.opened and self.position:
+            # Every element was skipped, drop what follows them in the target
+            os.truncate(self.target, self.offset)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class FieldSplitter:
+    """A file-like object cutting the bytes written to it into fields of
+    the given `lengths`, which are passed to `callback` as they complete."""
+
+    def __init__(self, lengths, callback):
+        self.lengths = deque(lengths)
+        self.callback = callback
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while self.lengths and len(self.buffer) >= self.lengths[0]:
+            length = self.lengths.popleft()
+            self.callback(bytes(self.buffer[:length]))
+            del self.buffer[:length]
+        return len(data)
+
+
+class BufferWriter:
+    """A file-like object writing into the memoryview `view`."""
+
+    def __init__(self, view):
+        self.view = view
+        self.position = 0
+
+    def write(self, data):
+        end = self.position + len(data)
+        if end > len(self.view):
+            raise ValueError(
+                "Received more than the %s bytes expected" % (len(self.view),)
+            )
+        self.view[self.position : end] = data
+        self.position = end
+        return len(data)
+
+
+class CountingWriter:
+    """A file-like object counting the bytes written to the file object `f`."""
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return self.f.write(data)
+
+
+def transfer_parts(url, parts, f, pbar, field_cache=None, **kwargs):
+    """Write the byte ranges `parts` of `url` to the file object `f`,
+    checking that the lengths of the ranges are honoured.
+
+    If a :class:`~ecmwf.opendata.cache.FieldCache` is given, only the
+    ranges that are not in the cache are downloaded, and added to it.
+    """
+    if field_cache is not None and parts is not None:
+        return _transfer_cached_parts(url, parts, f, pbar, field_cache, **kwargs)
+
+    single_range = kwargs.get("accept_multiple_ranges") is False
+    if parts is not None and single_range and kwargs.get("accept_ranges"):
+        # multiurl sends all the ranges but the first with requests.get(),
+        # outside of the session and its retry policy, so send them one by one
+        gap = getattr(kwargs.get("range_method"), "gap", 0)
+        groups = single_range_groups(parts, gap)
+        if len(groups) > 1:
+            return sum(transfer_parts(url, g, f, pbar, **kwargs) for g in groups)
+
+    start = time.perf_counter()
+    with phase("transfer"):
+        downloader = Downloader(url, parts=parts, **kwargs)
+        downloader.estimate_size(None)
+        # Parts out of order, e.g. with preserve_request_order, are sent as
+        # several downloads, and multiurl does not return their total size
+        writer = CountingWriter(f)
+        downloader.transfer(writer, pbar)
+        total = writer.size
+    add_transfer(url, total, time.perf_counter() - start)
+    if parts is not None:
+        expected = sum(length for _, length in parts)
+        if total != expected:
+            raise ValueError(
+                "Received %s bytes from %s instead of %s" % (total, url, expected)
+            )
+    return total
+
+
+def _transfer_cached_parts(url, parts, f, pbar, field_cache, **kwargs):
+    cached = {}
+    for part in parts:
+        if part not in cached:
+            cached[part] = field_cache.get(url, *part)
+            add_cache("field", cached[part] is not None)
+    missing = [part for part in parts if cached[part] is None]
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+        if missing:
+            LOG.debug(
+                "%s: %s of %s parts in cache",
+                url,
+                len(parts) - len(missing),
+                len(parts),
+            )
+            transfer_parts(url, missing, spool, pbar, **kwargs)
+            spool.seek(0)
+
+        total = 0
+        for part in parts:
+            data = cached[part]
+            if data is None:
+                data = spool.read(part[1])
+                field_cache.put(url, *part, data)
+                cached[part] = data
+            else:
+                pbar.update(len(data))
+            f.write(data)
+            total += len(data)
+
+    return total
+
+
+def pipelined_download(urls_and_parts, target, journal=None, **kwargs):
+    """Download an iterable of ``(url, parts)``, or of URLs, into `target`,
+    in order.
+
+    Each element is transferred as soon as it is produced, so when
+    `urls_and_parts` is a generator fed by index downloads, the data of
+    the first files is transferred while the remaining indexes are still
+    being fetched. The target is only created once the first element is
+    available. If a :class:`Journal` is given, the elements already in
+    the target are skipped.
+    """
+    total = 0
+    f = None
+    try:
+        with progress_bar(total=None, desc=os.path.basename(str(target))) as pbar:
+            for item in urls_and_parts:
+                url, parts = _url_and_parts(item)
+                if journal is not None and journal.skip(url, parts):
+                    continue
+                if f is None:
+                    f = open(target, "wb") if journal is None else journal.open()
+                total += transfer_parts(url, parts, f, pbar, **kwargs)
+                if journal is not None:
+                    journal.record(url, parts, f)
+    finally:
+        if f is not None:
+            f.close()
+
+    if journal is not None:
+        total += journal.offset
+        journal.close()
+    return total
+
+
+def parallel_download(
+    urls_and_parts, target, workers, limiter=None, journal=None, **kwargs
+):
+    """Download an iterable of ``(url, parts)``, or of URLs, into `target`
+    using up to `workers` threads.
+
+    Each element is downloaded into its own temporary file, and the files
+    are appended to `target` in the order of `urls_and_parts` as soon as
+    all the preceding ones are complete. At most ``2 * workers`` elements
+    are in flight, so the iterable is consumed lazily. If a
+    :class:`Journal` is given, the elements already in the target are
+    skipped.
+    """
+    if limiter is None:
+        limiter = HostLimiter()
+
+    directory = os.path.dirname(os.path.abspath(target))
+
+    def fetch(url, parts, pbar):
+        f = tempfile.TemporaryFile(dir=directory)
+        try:
+            with limiter(url):
+                transfer_parts(url, parts, f, pbar, **kwargs)
+            f.seek(0)
+        except BaseException:
+            f.close()
+            raise
+        return f
+
+    total = 0
+    out = None
+    pending = deque()
+
+    def append():
+        nonlocal out, total
+        url, parts, future = pending.popleft()
+        with future.result() as f:
+            if out is None:
+                out = open(target, "wb") if journal is None else journal.open()
+            shutil.copyfileobj(f, out, 1024 * 1024)
+            total += f.tell()
+        if journal is not None:
+            journal.record(url, parts, out)
+
+    try:
+        with progress_bar(
+            total=None, desc=os.path.basename(str(target))
+        ) as pbar, ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for item in urls_and_parts:
+                    url, parts = _url_and_parts(item)
+                    if journal is not None and journal.skip(url, parts):
+                        continue
+                    future = executor.submit(in_context(fetch), url, parts, pbar)
+                    pending.append((url, parts, future))
+                    if len(pending) >= 2 * workers:
+                        append()
+                while pending:
+                    append()
+            finally:
+                for _, _, future in pending:
+                    future.cancel()
+    finally:
+        for _, _, future in pending:
+            if future.done() and not future.cancelled() and not future.exception():
+                future.result().close()
+        if out is not None:
+            out.close()
+
+    if journal is not None:
+        total += journal.offset
+        journal.close()
+    return total
+
+
+def buffer_download(urls_parts_and_views, workers=1, limiter=None, **kwargs):
+    """Download a list of ``(url, parts, view)`` where `view` is a
+    memoryview of the exact size of `parts`, using up to `workers` threads.
+
+    As the views do not overlap, the transfers write directly into them,
+    without intermediate copies or temporary files.
+    """
+    if limiter is None:
+        limiter = HostLimiter()
+
+    def fetch(url, parts, view, pbar):
+        with limiter(url):
+            return transfer_parts(url, parts, BufferWriter(view), pbar, **kwargs)
+
+    with progress_bar(total=None, desc="memory") as pbar:
+        if workers <= 1 or len(urls_parts_and_views) <= 1:
+            return sum(fetch(*item, pbar) for item in urls_parts_and_views)
+
+        fetch = in_context(fetch)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(fetch, *item, pbar) for item in urls_parts_and_views
+            ]
+            return sum(future.result() for future in futures)
+
+
+def download_to_directory(urls_and_parts, directory, workers=1, limiter=None, **kwargs):
+    """Download each ``(url, parts)``, or URL, of a list into its own file
+    of `directory`, using up to `workers` threads, and return the paths
+    of the files in the same order."""
+    if limiter is None:
+        limiter = HostLimiter()
+
+    def fetch(n, item, pbar):
+        url, parts = _url_and_parts(item)
+        path = os.path.join(directory, str(n))
+        with limiter(url), open(path, "wb") as f:
+            transfer_parts(url, parts, f, pbar, **kwargs)
+        return path
+
+    with progress_bar(total=None, desc=os.path.basename(directory)) as pbar:
+        if workers <= 1 or len(urls_and_parts) <= 1:
+            return [fetch(n, item, pbar) for n, item in enumerate(urls_and_parts)]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(in_context(fetch), n, item, pbar)
+                for n, item in enumerate(urls_and_parts)
+            ]
+            return [future.result() for future in futures]
+
+
+class _Stopped(Exception):
+    pass
+
+
+_DONE = object()
+
+
+def stream_fields(urls_parts_and_entries, queue_size=16, limiter=None, **kwargs):
+    """Yield ``(entry, data)`` for an iterable of ``(url, parts, entries)``,
+    where `entries` describe the `parts` of `url`.
+
+    The data is transferred by a background thread, which blocks when
+    `queue_size` fields are waiting to be consumed, so memory use is
+    bounded whatever the size of the request. Closing the generator stops
+    the transfer.
+    """
+    if limiter is None:
+        limiter = HostLimiter()
+
+    queue = Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+        raise _Stopped()
+
+    def produce():
+        try:
+            with progress_bar(total=None, desc="stream") as pbar:
+                for url, parts, entries in urls_parts_and_entries:
+                    entries = deque(entries)
+                    splitter = FieldSplitter(
+                        [length for _, length in parts],
+                        lambda data: put((entries.popleft(), data)),
+                    )
+                    with limiter(url):
+                        transfer_parts(url, parts, splitter, pbar, **kwargs)
+            put(_DONE)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            try:
+                put(e)
+            except _Stopped:
+                pass
+        finally:
+            close = getattr(urls_parts_and_entries, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=in_context(produce), daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
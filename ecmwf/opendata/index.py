@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import json
+from array import array
+from collections import Counter, defaultdict
+from itertools import compress, islice
+from operator import itemgetter, methodcaller
+
+
+class Index:
+    """Columnar representation of an ``.index`` file.
+
+    Each keyword is dictionary-encoded: its distinct values are numbered,
+    and the column holds one code per entry (entries that do not have
+    that keyword get the code of ``None``). Postings lists map each code
+    to the entries that have it, so matching a request only visits the
+    entries selected by its most selective keyword.
+
+    Columns are built on first use, so that a freshly downloaded index
+    only pays for the keywords of the request, and is matched by scanning
+    them. Postings are only built before the index is pickled, for the
+    indexes that are cached and matched again.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = list(entries)
+        self._names = None
+        self.offsets = array("q", map(itemgetter("_offset"), self._entries))
+        self.lengths = array("q", map(itemgetter("_length"), self._entries))
+        self.columns = {}
+        self.dictionaries = {}
+        self.postings = {}
+
+    @classmethod
+    def from_lines(cls, lines, batch=1024):
+        """Parse the lines of an index file, `batch` lines per call to the
+        JSON decoder."""
+        entries = []
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, batch))
+            if not chunk:
+                break
+            chunk = [line for line in chunk if line]
+            if not chunk:
+                continue
+            if isinstance(chunk[0], bytes):
+                entries += json.loads(b"[" + b",".join(chunk) + b"]")
+            else:
+                entries += json.loads("[" + ",".join(chunk) + "]")
+        return cls(entries)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getstate__(self):
+        for name in self.names:
+            self._postings(name)
+        state = dict(self.__dict__)
+        state["_entries"] = []
+        return state
+
+    @property
+    def names(self):
+        if self._names is None:
+            names = set().union(*self._entries)
+            self._names = {n for n in names if not n.startswith("_")}
+        return self._names
+
+    def _column(self, name):
+        column = self.columns.get(name)
+        if column is None:
+            try:
+                values = list(map(itemgetter(name), self._entries))
+            except KeyError:
+                values = list(map(methodcaller("get", name), self._entries))
+            codes = {value: code for code, value in enumerate(dict.fromkeys(values))}
+            column = self.columns[name] = array("i", map(codes.__getitem__, values))
+            self.dictionaries[name] = codes
+        return column
+
+    def _dictionary(self, name):
+        if name.startswith("_"):
+            return {}
+        self._column(name)
+        return self.dictionaries[name]
+
+    def _postings(self, name):
+        postings = self.postings.get(name)
+        if postings is None:
+            postings = defaultdict(list)
+            for row, code in enumerate(self._column(name)):
+                postings[code].append(row)
+            postings = self.postings[name] = dict(postings)
+        return postings
+
+    def _selectivity(self, name, codes):
+        """Number of entries with one of the `codes` of keyword `name`."""
+        postings = self.postings.get(name)
+        if postings is None:
+            postings = Counter(self._column(name))
+            return sum(postings[code] for code in codes)
+        return sum(len(postings[code]) for code in codes)
+
+    def possible_values(self, name):
+        return [v for v in self._dictionary(name) if v is not None]
+
+    def entries(self, rows):
+        """Return the entries at positions `rows`, as parsed from the index
+        file."""
+        columns = [
+            (name, self._column(name), list(self.dictionaries[name]))
+            for name in sorted(self.names)
+        ]
+        result = []
+        for row in rows:
+            entry = {}
+            for name, column, values in columns:
+                value = values[column[row]]
+                if value is not None:
+                    entry[name] = value
+            entry["_offset"] = self.offsets[row]
+            entry["_length"] = self.lengths[row]
+            result.append(entry)
+        return result
+
+    def match(self, for_index, preserve_request_order=False):
+        """Return the ``(offset, length)`` of the entries matching all the
+        keywords of `for_index`, sorted by offset, or by position of their
+        values in the request if `preserve_request_order` is set."""
+        if not for_index:
+            return []
+        offsets, lengths = self.offsets, self.lengths
+        rows = self.match_rows(for_index, preserve_request_order)
+        return [(offsets[row], lengths[row]) for row in rows]
+
+    def match_rows(self, for_index, preserve_request_order=False):
+        """Like :meth:`match`, but return the positions of the entries in
+        the index. All the entries match an empty `for_index`."""
+
+        if not for_index:
+            return list(range(len(self)))
+
+        wanted = []
+        for name, values in for_index.items():
+            codes = self._dictionary(name)
+            ranks = {}
+            for rank, value in enumerate(values):
+                if value in codes:
+                    ranks.setdefault(codes[value], rank)
+            if not ranks:
+                return []
+            if len(for_index) == 1:
+                wanted.append((0, name, ranks))
+            else:
+                wanted.append((self._selectivity(name, ranks), name, ranks))
+
+        _, first, ranks = min(wanted, key=lambda x: x[0])
+        postings = self.postings.get(first)
+        if postings is None:
+            column = self._column(first)
+            rows = list(compress(range(len(column)), map(ranks.__contains__, column)))
+        else:
+            rows = [row for code in ranks for row in postings[code]]
+
+        for _, name, ranks in wanted:
+            if name == first:
+                continue
+            column = self._column(name)
+            rows = [row for row in rows if column[row] in ranks]
+
+        offsets, lengths = self.offsets, self.lengths
+
+        if preserve_request_order:
+            keys = [(self.columns[name], ranks) for _, name, ranks in wanted]
+            rows.sort(
+                key=lambda row: (
+                    tuple(ranks[column[row]] for column, ranks in keys),
+                    offsets[row],
+                    lengths[row],
+                )
+            )
+        else:
+            rows.sort(key=lambda row: (offsets[row], lengths[row]))
+
+        return rows
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from .stats import Hooks
+
+LOG = logging.getLogger(__name__)
+
+# Same as the Prometheus client libraries
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# 1 KiB/s to 1 GiB/s
+THROUGHPUT_BUCKETS = tuple(2**n for n in range(10, 31, 2))
+
+# Name: (type, help, buckets)
+METRICS = {
+    "opendata_requests_total": (
+        "counter",
+        "HTTP requests sent, by method, kind (index, data or head), host and status",
+        None,
+    ),
+    "opendata_request_seconds": (
+        "histogram",
+        "Latency of the HTTP requests, until the headers are received",
+        LATENCY_BUCKETS,
+    ),
+    "opendata_retries_total": (
+        "counter",
+        "HTTP requests that failed with an error on which they are retried",
+        None,
+    ),
+    "opendata_received_bytes_total": (
+        "counter",
+        "Bytes received, by host",
+        None,
+    ),
+    "opendata_transfer_bytes_per_second": (
+        "histogram",
+        "Throughput of the transfers of index files and byte ranges",
+        THROUGHPUT_BUCKETS,
+    ),
+    "opendata_phase_seconds": (
+        "histogram",
+        "Time spent in each phase of the client calls",
+        LATENCY_BUCKETS,
+    ),
+    "opendata_cache_lookups_total": (
+        "counter",
+        "Lookups of the index, field and latest caches, by result (hit or miss)",
+        None,
+    ),
+    "opendata_latest_probes_total": (
+        "counter",
+        "Files checked by latest(), by status",
+        None,
+    ),
+}
+
+
+class Metrics:
+    """A sink for counters and histograms. This one does nothing; subclass
+    it to send the metrics to a monitoring system.
+
+    `name` is a key of :data:`METRICS`, and `labels` are strings.
+    """
+
+    def inc(self, name, value=1, **labels):
+        """Add `value` to a counter."""
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a histogram."""
+
+
+class PrometheusMetrics(Metrics):
+    """Accumulate the metrics in memory, to be exported in the Prometheus
+    text format with :meth:`render`, or written with :meth:`write` to a file
+    collected by the node exporter textfile collector.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = METRICS[name][2]
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            counts = histogram[0]
+            n = bisect_left(buckets, value)
+            if n < len(counts):
+                counts[n] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self.histograms.items()
+            }
+
+        samples = defaultdict(list)
+        for (name, labels), value in counters.items():
+            samples[name].append(_sample(name, labels, value))
+
+        for (name, labels), (counts, total, count) in histograms.items():
+            cumulated = 0
+            for bound, n in zip(METRICS[name][2], counts):
+                cumulated += n
+                bucket = labels + (("le", _number(bound)),)
+                samples[name].append(_sample(name + "_bucket", bucket, cumulated))
+            bucket = labels + (("le", "+Inf"),)
+            samples[name].append(_sample(name + "_bucket", bucket, count))
+            samples[name].append(_sample(name + "_sum", labels, total))
+            samples[name].append(_sample(name + "_count", labels, count))
+
+        lines = []
+        for name in sorted(samples):
+            kind, text, _ = METRICS[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples[name])
+        return "".join(line + "\n" for line in lines)
+
+    def write(self, path=None):
+        """Write the metrics to `path`, atomically."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path to write the metrics to")
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _sample(name, labels, value):
+    if labels:
+        name += "{%s}" % ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return f"{name} {_number(value)}"
+
+
+def _kind(method, url):
+    if method == "HEAD":
+        return "head"
+    if urlparse(url).path.endswith(".index"):
+        return "index"
+    return "data"
+
+
+class MetricsHooks(Hooks):
+    """Report the activity of a :class:`Client` to a :class:`Metrics`."""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def on_phase(self, name, seconds):
+        self.metrics.observe("opendata_phase_seconds", seconds, phase=name)
+
+    def on_request(self, method, url, status, seconds):
+        kind = _kind(method, url)
+        host = urlparse(url).netloc
+        self.metrics.inc(
+            "opendata_requests_total",
+            method=method,
+            kind=kind,
+            host=host,
+            status=str(status),
+        )
+        self.metrics.observe("opendata_request_seconds", seconds, kind=kind, host=host)
+
+    def on_retry(self, method, url, reason):
+        self.metrics.inc(
+            "opendata_retries_total",
+            method=method,
+            kind=_kind(method, url),
+            host=urlparse(url).netloc,
+        )
+
+    def on_transfer(self, url, size, seconds):
+        host = urlparse(url).netloc
+        self.metrics.inc("opendata_received_bytes_total", size, host=host)
+        if seconds > 0:
+            self.metrics.observe(
+                "opendata_transfer_bytes_per_second",
+                size / seconds,
+                kind=_kind("GET", url),
+                host=host,
+            )
+
+    def on_cache(self, cache, hit):
+        self.metrics.inc(
+            "opendata_cache_lookups_total",
+            cache=cache,
+            result="hit" if hit else "miss",
+        )
+
+    def on_probe(self, url, status):
+        self.metrics.inc("opendata_latest_probes_total", status=str(status))
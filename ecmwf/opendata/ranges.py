@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# Same limit as multiurl, which splits larger multi-range requests
+# (Nginx default header size is 4K)
+MAX_RANGE_HEADER = 4000
+
+
+def ascending_runs(parts):
+    """Split `parts` into runs of increasing offsets, as multiurl does."""
+    runs = []
+    last = None
+    for offset, length in parts:
+        if last is None or offset < last:
+            runs.append([])
+        runs[-1].append((offset, length))
+        last = offset
+    return runs
+
+
+def coalesce(parts, gap=0):
+    """Merge byte ranges that are less than `gap` bytes apart.
+
+    `parts` is a sequence of ``(offset, length)`` in increasing order. The
+    bytes between merged ranges are downloaded and discarded, trading
+    over-read for fewer range requests. With ``gap=0`` only adjacent
+    ranges are merged, which is lossless.
+    """
+    blocks = []
+    for offset, length in parts:
+        if blocks:
+            start, size = blocks[-1]
+            end = start + size
+            if start <= offset and offset - end <= gap:
+                blocks[-1] = (start, max(end, offset + length) - start)
+                continue
+        blocks.append((offset, length))
+    return blocks
+
+
+def single_range_groups(parts, gap=0):
+    """Split `parts` into groups of consecutive parts that :func:`coalesce`
+    merges into a single byte range."""
+    groups = []
+    for run in ascending_runs(parts):
+        end = None
+        for offset, length in run:
+            if end is not None and offset - end <= gap:
+                groups[-1].append((offset, length))
+                end = max(end, offset + length)
+            else:
+                groups.append([(offset, length)])
+                end = offset + length
+    return groups
+
+
+def multi_range_requests(blocks):
+    """Split `blocks` into the multi-range requests multiurl issues to
+    download them, keeping each ``Range`` header short enough."""
+    ranges = ",".join(f"{offset}-{offset + length - 1}" for offset, length in blocks)
+    if len(blocks) == 1 or len(f"bytes={ranges}") <= MAX_RANGE_HEADER:
+        return [blocks]
+
+    middle = len(blocks) // 2
+    return multi_range_requests(blocks[:middle]) + multi_range_requests(blocks[middle:])
+
+
+def count_requests(blocks, accept_multiple_ranges):
+    """Number of HTTP requests multiurl issues to download `blocks`."""
+    if not blocks:
+        return 0
+
+    if accept_multiple_ranges is False:
+        return len(blocks)
+
+    return len(multi_range_requests(blocks))
+
+
+def split_parts(urls_and_parts, count):
+    """Split a list of ``(url, parts)`` into `count` shards of about the
+    same number of bytes.
+
+    The shards are contiguous: concatenating the data of the shards, in
+    order, gives the data of `urls_and_parts`. A part goes to the shard
+    that contains its middle byte, so the split only depends on the list,
+    and shards differ by at most the size of a part.
+    """
+    if count < 1:
+        raise ValueError("Invalid number of shards: %r" % (count,))
+
+    total = sum(length for _, parts in urls_and_parts for _, length in parts)
+    shards = [[] for _ in range(count)]
+    position = 0
+    for url, parts in urls_and_parts:
+        for part in parts:
+            length = part[1]
+            n = min(count - 1, (2 * position + length) * count // (2 * total))
+            position += length
+            shard = shards[n]
+            if shard and shard[-1][0] == url:
+                shard[-1][1].append(part)
+            else:
+                shard.append((url, [part]))
+
+    return [[(url, tuple(parts)) for url, parts in shard] for shard in shards]
+
+
+@dataclass
+class FilePlan:
+    url: str
+    parts: int
+    bytes: int
+    blocks: List[Tuple[int, int]]
+    requests: int
+
+    @property
+    def over_read(self):
+        return sum(length for _, length in self.blocks) - self.bytes
+
+
+@dataclass
+class RangePlan:
+    """Summary of the range requests needed to download a list of
+    ``(url, parts)``, with the breakdown per file in `files`."""
+
+    gap: int = 0
+    accept_ranges: Optional[bool] = None
+    accept_multiple_ranges: Optional[bool] = None
+    files: List[FilePlan] = field(default_factory=list)
+
+    def add(self, url, parts):
+        blocks = []
+        requests = 0
+        for run in ascending_runs(parts):
+            if self.accept_ranges is False:
+                # The whole file is downloaded and filtered locally
+                blocks.extend(run)
+                requests += 1
+                continue
+            merged = coalesce(run, self.gap)
+            blocks.extend(merged)
+            requests += count_requests(merged, self.accept_multiple_ranges)
+
+        plan = FilePlan(
+            url=url,
+            parts=len(parts),
+            bytes=sum(length for _, length in parts),
+            blocks=blocks,
+            requests=requests,
+        )
+        self.files.append(plan)
+        return plan
+
+    def add_file(self, url, size):
+        """Add a file downloaded whole, with a single request."""
+        plan = FilePlan(url=url, parts=0, bytes=size, blocks=[(0, size)], requests=1)
+        self.files.append(plan)
+        return plan
+
+    @property
+    def parts(self):
+        return sum(f.parts for f in self.files)
+
+    @property
+    def requests(self):
+        return sum(f.requests for f in self.files)
+
+    @property
+    def bytes(self):
+        return sum(f.bytes for f in self.files)
+
+    @property
+    def over_read(self):
+        return sum(f.over_read for f in self.files)
+
+    def __repr__(self):
+        return (
+            f"RangePlan(files={len(self.files)}, parts={self.parts},"
+            f" requests={self.requests}, bytes={self.bytes},"
+            f" over_read={self.over_read})"
+        )
+
+
+class RangeMethod:
+    """A multiurl ``range_method`` that coalesces ranges closer than `gap`."""
+
+    def __init__(self, gap):
+        self.gap = gap
+
+    def __call__(self, parts):
+        return coalesce(parts, self.gap)
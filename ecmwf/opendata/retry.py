@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import functools
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from multiurl.http import RETRIABLE
+
+from .stats import RETRIABLE_ERRORS
+
+LOG = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised instead of sending a request to a host that keeps failing."""
+
+
+@dataclass
+class RetryPolicy:
+    """How failed requests are retried.
+
+    A request is retried when it fails with a connection error, or with one
+    of the HTTP `statuses`. The n-th retry waits ``backoff * multiplier **
+    (n - 1)`` seconds, capped at `maximum_delay`. With `jitter`, the wait is
+    drawn uniformly between 0 and that value, so that clients failing
+    together do not retry together. When the server sends a ``Retry-After``
+    header, it is used instead, up to `maximum_delay`.
+
+    Retrying stops after `maximum_tries` attempts, or when the next attempt
+    would start more than `maximum_elapsed` seconds after the first one.
+    The last error, or the last response, is then returned to the caller.
+    """
+
+    maximum_tries: int = 500
+    backoff: float = 1.0
+    multiplier: float = 2.0
+    maximum_delay: float = 120.0
+    maximum_elapsed: Optional[float] = None
+    jitter: bool = True
+    statuses: Tuple[int, ...] = RETRIABLE
+
+    def delay(self, retry, response=None):
+        """Seconds to wait before the `retry`-th retry."""
+        if response is not None and "retry-after" in response.headers:
+            try:
+                return min(float(response.headers["retry-after"]), self.maximum_delay)
+            except ValueError:
+                pass
+
+        delay = min(self.backoff * self.multiplier ** (retry - 1), self.maximum_delay)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+class CircuitBreaker:
+    """Stop sending requests to a host after `failures` consecutive
+    failures (connection errors or retriable HTTP statuses).
+
+    While the circuit of a host is open, requests fail immediately with
+    :class:`CircuitOpenError`. After `reset_after` seconds, one request is
+    let through: the circuit closes if it succeeds, and opens again if it
+    fails.
+    """
+
+    def __init__(self, failures=5, reset_after=30):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def check(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            failures, opened = self.hosts.get(host, (0, None))
+            if opened is None:
+                return
+
+            waited = time.monotonic() - opened
+            if waited < self.reset_after:
+                raise CircuitOpenError(
+                    "Too many errors from %s, not retrying for %.0f seconds"
+                    % (host, self.reset_after - waited)
+                )
+
+            # Let this request through, the others still fail fast
+            self.hosts[host] = (failures, time.monotonic())
+
+    def success(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.hosts.pop(host, None)
+
+    def failure(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            failures, opened = self.hosts.get(host, (0, None))
+            failures += 1
+            if failures >= self.failures:
+                if opened is None:
+                    LOG.warning("%s failures in a row from %s", failures, host)
+                opened = time.monotonic()
+            self.hosts[host] = (failures, opened)
+
+
+def retry_factory(retry):
+    if retry is None:
+        return RetryPolicy()
+
+    if isinstance(retry, RetryPolicy):
+        return retry
+
+    raise TypeError("Invalid retry policy: %r" % (retry,))
+
+
+def circuit_breaker_factory(circuit_breaker):
+    if circuit_breaker is None or circuit_breaker is False:
+        return None
+
+    if circuit_breaker is True:
+        return CircuitBreaker()
+
+    if isinstance(circuit_breaker, CircuitBreaker):
+        return circuit_breaker
+
+    raise TypeError("Invalid circuit breaker: %r" % (circuit_breaker,))
+
+
+def retrying(session, policy, breaker=None):
+    """Retry the requests sent by a :class:`requests.Session` according to
+    `policy`, checking the circuits of `breaker` before each attempt."""
+    request = session.request
+
+    @functools.wraps(request)
+    def wrapped(method, url, *args, **kwargs):
+        start = time.monotonic()
+        tries = 0
+        while True:
+            tries += 1
+            if breaker is not None:
+                breaker.check(url)
+
+            try:
+                response = request(method, url, *args, **kwargs)
+            except requests.exceptions.SSLError:
+                raise
+            except RETRIABLE_ERRORS as e:
+                response, error = None, e
+            else:
+                if response.status_code not in policy.statuses:
+                    if breaker is not None:
+                        breaker.success(url)
+                    return response
+                error = "%s %s" % (response.status_code, response.reason)
+
+            if breaker is not None:
+                breaker.failure(url)
+
+            delay = policy.delay(tries, response)
+            elapsed = time.monotonic() - start + delay
+            if tries >= policy.maximum_tries or (
+                policy.maximum_elapsed is not None and elapsed > policy.maximum_elapsed
+            ):
+                if response is None:
+                    raise error
+                return response
+
+            LOG.warning(
+                "Recovering from error [%s] on %s, attempt %s of %s, retry in %.1fs",
+                error,
+                url,
+                tries,
+                policy.maximum_tries,
+                delay,
+            )
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    session.request = wrapped
+    return session
@@ -3,6 +3,10 @@ from typing import Optional
 
 from .urls import URLS
 
+# Bytes that may be downloaded and discarded to save a range request on
+# sources that only accept one range per request
+CLOUD_RANGE_GAP = 1024 * 1024
+
 
 @dataclass
 class Source:
@@ -10,10 +14,14 @@ class Source:
     name: Optional[str] = None
     accept_ranges: Optional[bool] = None
     accept_multiple_ranges: Optional[bool] = None
+    range_gap: int = 0
 
 
 def source_factory(
-    name: str, accept_ranges: Optional[bool], accept_multiple_ranges: Optional[bool]
+    name: str,
+    accept_ranges: Optional[bool],
+    accept_multiple_ranges: Optional[bool],
+    range_gap: Optional[int] = None,
 ) -> Source:
     """Create a Source instance for the given name or URL.
 
@@ -29,6 +37,10 @@ def source_factory(
         Override whether the source supports multiple byte-range requests
         in a single request. ``None`` lets the source infer support from
         response headers.
+    range_gap : int, optional
+        Override the number of bytes allowed between two byte ranges for
+        them to be merged into a single range request. ``None`` keeps the
+        default of the source.
 
     Returns
     -------
@@ -43,10 +55,15 @@ def source_factory(
     """
     if name in URLS.keys():
         url = URLS[name]
-        # special case: cloud storages do not allow for multiple ranges
+        # special case: cloud storages do not allow for multiple ranges,
+        # so nearby ranges are merged to reduce the number of requests
         if name in ["aws", "azure", "google"]:
             source = Source(
-                name=name, url=url, accept_ranges=True, accept_multiple_ranges=False
+                name=name,
+                url=url,
+                accept_ranges=True,
+                accept_multiple_ranges=False,
+                range_gap=CLOUD_RANGE_GAP,
             )
 
         # standard case: multiurl infers range request support from response headers
@@ -64,4 +81,6 @@ def source_factory(
         source.accept_ranges = accept_ranges
     if accept_multiple_ranges is not None:
         source.accept_multiple_ranges = accept_multiple_ranges
+    if range_gap is not None:
+        source.range_gap = range_gap
     return source
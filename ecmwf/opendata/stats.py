@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# (C) Copyright 2021 ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+#
+
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import requests
+from multiurl.http import RETRIABLE
+
+# Statistics of the Client call in progress
+CURRENT = contextvars.ContextVar("ecmwf_opendata_stats", default=None)
+
+# Errors on which multiurl retries a request
+RETRIABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ReadTimeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class Hooks:
+    """Receives the activity of a :class:`Client`. All the methods do
+    nothing; subclass this and override the ones you need.
+
+    The methods may be called from several threads at once.
+    """
+
+    def on_phase(self, name, seconds):
+        """A phase (``latest``, ``urls``, ``index``, ``parse`` or
+        ``transfer``) has run for `seconds`. The ``latest`` phase includes
+        the ``urls`` phases of the runs it probes."""
+
+    def on_request(self, method, url, status, seconds):
+        """An HTTP request was answered with `status` (None if it failed)
+        after `seconds`."""
+
+    def on_retry(self, method, url, reason):
+        """An HTTP request failed with `reason`, an HTTP status code or an
+        exception on which requests are retried."""
+
+    def on_transfer(self, url, size, seconds):
+        """`size` bytes of `url` were received in `seconds`."""
+
+    def on_cache(self, cache, hit):
+        """The ``index``, ``field`` or ``latest`` cache was looked up."""
+
+    def on_probe(self, url, status):
+        """`latest` checked the existence of `url`, with HTTP `status`."""
+
+    def on_stats(self, stats):
+        """A call to the client has completed, with :class:`Stats`."""
+
+
+class MultipleHooks(Hooks):
+    """Forward the activity of a :class:`Client` to several hooks."""
+
+    def __init__(self, *hooks):
+        self.hooks = hooks
+
+    def on_phase(self, name, seconds):
+        for hooks in self.hooks:
+            hooks.on_phase(name, seconds)
+
+    def on_request(self, method, url, status, seconds):
+        for hooks in self.hooks:
+            hooks.on_request(method, url, status, seconds)
+
+    def on_retry(self, method, url, reason):
+        for hooks in self.hooks:
+            hooks.on_retry(method, url, reason)
+
+    def on_transfer(self, url, size, seconds):
+        for hooks in self.hooks:
+            hooks.on_transfer(url, size, seconds)
+
+    def on_cache(self, cache, hit):
+        for hooks in self.hooks:
+            hooks.on_cache(cache, hit)
+
+    def on_probe(self, url, status):
+        for hooks in self.hooks:
+            hooks.on_probe(url, status)
+
+    def on_stats(self, stats):
+        for hooks in self.hooks:
+            hooks.on_stats(stats)
+
+
+@dataclass
+class HostStats:
+    requests: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self):
+        """Bytes per second received from the host."""
+        if not self.seconds:
+            return None
+        return self.bytes / self.seconds
+
+
+class Stats:
+    """Statistics of a call to :class:`Client`.
+
+    The time of each phase is summed over the threads, so with concurrent
+    index or data downloads it can exceed the `elapsed` wall time.
+    """
+
+    def __init__(self, hooks=None):
+        self.hooks = hooks if hooks is not None else Hooks()
+        self.lock = threading.Lock()
+        self.phases = defaultdict(float)
+        self.requests = defaultdict(int)
+        self.retries = 0
+        self.bytes = 0
+        self.hosts = defaultdict(HostStats)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.probes = 0
+        self.start = time.perf_counter()
+        self.elapsed = None
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] += seconds
+        self.hooks.on_phase(name, seconds)
+
+    def add_request(self, method, url, status, seconds):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.requests[method] += 1
+            self.hosts[host].requests += 1
+        self.hooks.on_request(method, url, status, seconds)
+
+    def add_retry(self, method, url, reason):
+        with self.lock:
+            self.retries += 1
+        self.hooks.on_retry(method, url, reason)
+
+    def add_transfer(self, url, size, seconds):
+        host = urlparse(url).netloc
+        with self.lock:
+            self.bytes += size
+            self.hosts[host].bytes += size
+            self.hosts[host].seconds += seconds
+        self.hooks.on_transfer(url, size, seconds)
+
+    def add_cache(self, cache, hit):
+        with self.lock:
+            if hit:
+                self.cache_hits[cache] += 1
+            else:
+                self.cache_misses[cache] += 1
+        self.hooks.on_cache(cache, hit)
+
+    def add_probe(self, url, status):
+        with self.lock:
+            self.probes += 1
+        self.hooks.on_probe(url, status)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start
+        self.hooks.on_stats(self)
+
+    def __getstate__(self):
+        # Results are sent back by backfill() worker processes
+        state = dict(self.__dict__)
+        del state["lock"]
+        state["hooks"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        phases = ", ".join(f"{k}={v:.3f}s" for k, v in self.phases.items())
+        return (
+            f"Stats(elapsed={self.elapsed or 0:.3f}s, {phases},"
+            f" requests={sum(self.requests.values())}, retries={self.retries},"
+            f" bytes={self.bytes})"
+        )
+
+
+@contextmanager
+def collect(hooks=None):
+    """Collect the statistics of the code in the block, unless they are
+    already collected by an enclosing block."""
+    stats = CURRENT.get()
+    if stats is not None:
+        yield stats
+        return
+
+    stats = Stats(hooks)
+    token = CURRENT.set(stats)
+    try:
+        yield stats
+    finally:
+        CURRENT.reset(token)
+        stats.finish()
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def add_phase(name, seconds):
+    stats = CURRENT.get()
+    if stats is not None:
+        stats.add_phase(name, seconds)
+
+
+def add_transfer(url, size, seconds):
+    stats = CURRENT.get()
+    if stats is not None:
+        stats.add_transfer(url, size, seconds)
+
+
+def add_cache(cache, hit):
+    stats = CURRENT.get()
+    if stats is not None:
+        stats.add_cache(cache, hit)
+
+
+def add_probe(url, status):
+    stats = CURRENT.get()
+    if stats is not None:
+        stats.add_probe(url, status)
+
+
+def in_context(func):
+    """Wrap `func` so that it runs with the statistics of the caller, as
+    threads do not inherit them."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapped
+
+
+def instrument(session, statuses=RETRIABLE):
+    """Record all the requests sent by a :class:`requests.Session`, counting
+    the HTTP `statuses` on which requests are retried as retries."""
+    request = session.request
+
+    @functools.wraps(request)
+    def wrapped(method, url, *args, **kwargs):
+        stats = CURRENT.get()
+        if stats is None:
+            return request(method, url, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            response = request(method, url, *args, **kwargs)
+        except RETRIABLE_ERRORS as e:
+            stats.add_request(method, url, None, time.perf_counter() - start)
+            stats.add_retry(method, url, e)
+            raise
+
+        elapsed = time.perf_counter() - start
+        stats.add_request(method, url, response.status_code, elapsed)
+        if response.status_code in statuses:
+            stats.add_retry(method, url, response.status_code)
+        return response
+
+    session.request = wrapped
+    return session
+
+
+class TimedIterator:
+    """Iterate over `iterable`, measuring the time spent waiting for it."""
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
@@ -42,6 +42,7 @@ setuptools.setup(
     packages=setuptools.find_namespace_packages(include=["ecmwf.*"]),
     include_package_data=True,
     install_requires=["multiurl>=0.3.8"],
+    extras_require={"async": ["aiohttp"]},
     zip_safe=True,
     keywords="tool",
     classifiers=[
@@ -0,0 +1,8 @@
+import pytest
+from server import OpenDataServer
+
+
+@pytest.fixture
+def server():
+    with OpenDataServer() as server:
+        yield server
@@ -0,0 +1,257 @@
+"""
+A local stand-in for the open data portal, for testing
+"""
+
+import datetime
+import json
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ecmwf.opendata.client import EXTENSIONS, HOURLY_PATTERN, MONTHLY_PATTERN, PATTERNS
+
+BOUNDARY = "3d6b6a416f9b5"
+
+# Fields of the files added by the tests, each of 64 bytes
+FIELDS = [{"param": p} for p in ("2t", "msl", "10u", "10v")]
+
+
+def fake_grib(length, tag=b""):
+    assert length >= 8 + len(tag)
+    body = tag + b"\0" * (length - 8 - len(tag))
+    return b"GRIB" + body + b"7777"
+
+
+def parse_ranges(value, size):
+    assert value.startswith("bytes="), value
+    ranges = []
+    for r in value[len("bytes=") :].split(","):
+        start, end = r.strip().split("-")
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+        ranges.append((start, end))
+    return ranges
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, do not wait for an ACK
+    # between them
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _enter(self):
+        server = self.server.opendata
+        with server.lock:
+            server.requests[self.command].append(self.path)
+            server.connections.add(self.client_address)
+            server.log.append((self.command, self.path))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        if server.delay:
+            time.sleep(server.delay)
+
+    def _leave(self):
+        server = self.server.opendata
+        with server.lock:
+            server.active -= 1
+            server.log.append(("DONE", self.path))
+
+    def _lookup(self):
+        path = self.path.split("?")[0]
+        return self.server.opendata.files.get(path)
+
+    def _send(self, code, body=b"", headers=None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _fail(self):
+        # Answer with an error the first times a path, or a range of a
+        # path, is requested
+        server = self.server.opendata
+        path = self.path.split("?")[0]
+        with server.lock:
+            for key in (path, (path, self.headers.get("range"))):
+                if server.failures.get(key):
+                    server.failures[key] -= 1
+                    break
+            else:
+                return False
+        self._send(503)
+        return True
+
+    def do_HEAD(self):
+        self._enter()
+        try:
+            if self._fail():
+                return
+            data = self._lookup()
+            if data is None:
+                self._send(404)
+            else:
+                self.send_response(200)
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+        finally:
+            self._leave()
+
+    def do_GET(self):
+        self._enter()
+        try:
+            server = self.server.opendata
+            if self._fail():
+                return
+            data = self._lookup()
+            if data is None:
+                self._send(404)
+                return
+
+            if "range" not in self.headers:
+                self._send(200, data, {"Accept-Ranges": "bytes"})
+                return
+
+            ranges = parse_ranges(self.headers["range"], len(data))
+            with server.lock:
+                server.ranges.append((self.path, ranges))
+
+            if len(ranges) == 1 or not server.accept_multiple_ranges:
+                start, end = ranges[0]
+                self._send(
+                    206,
+                    data[start : end + 1],
+                    {
+                        "Content-Range": f"bytes {start}-{end}/{len(data)}",
+                        "Content-Type": "application/octet-stream",
+                    },
+                )
+                return
+
+            body = []
+            for start, end in ranges:
+                body.append(
+                    (
+                        f"--{BOUNDARY}\r\n"
+                        "Content-Type: application/octet-stream\r\n"
+                        f"Content-Range: bytes {start}-{end}/{len(data)}\r\n\r\n"
+                    ).encode()
+                )
+                body.append(data[start : end + 1])
+                body.append(b"\r\n")
+            body.append(f"--{BOUNDARY}--\r\n".encode())
+
+            self._send(
+                206,
+                b"".join(body),
+                {"Content-Type": f"multipart/byteranges; boundary={BOUNDARY}"},
+            )
+        finally:
+            self._leave()
+
+
+class OpenDataServer:
+    def __init__(self, delay=0, accept_multiple_ranges=True):
+        self.files = {}
+        self.failures = {}
+        self.delay = delay
+        self.accept_multiple_ranges = accept_multiple_ranges
+        self.lock = threading.Lock()
+        self.reset()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.opendata = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        self.requests = defaultdict(list)
+        self.log = []
+        self.ranges = []
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_file(
+        self,
+        date,
+        time,
+        step,
+        fields,
+        model="ifs",
+        resol="0p25",
+        stream="oper",
+        type="fc",
+        length=64,
+    ):
+        """Add a data file and its index; `fields` is a list of dicts of
+        index keys (param, levelist, number, ...). For monthly streams
+        (``mmsf``), `step` is the forecast month."""
+        date = datetime.datetime.strptime(str(date), "%Y%m%d") + datetime.timedelta(
+            hours=time
+        )
+        pattern = PATTERNS.get(stream, HOURLY_PATTERN)
+        step_key = "fcmonth" if pattern is MONTHLY_PATTERN else "step"
+        url = pattern.format(
+            _url="",
+            _yyyymmdd=date.strftime("%Y%m%d"),
+            _H=date.strftime("%H"),
+            model=model,
+            resol=resol,
+            _stream=stream,
+            _yyyymmddHHMMSS=date.strftime("%Y%m%d%H%M%S"),
+            step=step,
+            fcmonth=step,
+            type=type,
+            _extension=EXTENSIONS.get(type, "grib2"),
+        )
+
+        data = []
+        index = []
+        offset = 0
+        for i, field in enumerate(fields):
+            entry = dict(
+                date=date.strftime("%Y%m%d"),
+                time=date.strftime("%H%M"),
+                stream=stream,
+                type=field.get("type", type),
+                **{step_key: str(step)},
+                levtype="pl" if "levelist" in field else "sfc",
+            )
+            entry.update({k: str(v) for k, v in field.items()})
+            message = fake_grib(length, tag=b"%d" % (i,))
+            entry["_offset"] = offset
+            entry["_length"] = len(message)
+            offset += len(message)
+            data.append(message)
+            index.append(json.dumps(entry))
+
+        self.files[url] = b"".join(data)
+        self.files[url.rsplit(".", 1)[0] + ".index"] = "\n".join(index).encode()
+
+        return url
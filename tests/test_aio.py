@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+
+import pytest
+from server import FIELDS
+
+from ecmwf.opendata import AsyncClient, CircuitBreaker, RetryPolicy
+from ecmwf.opendata.retry import CircuitOpenError
+
+pytest.importorskip("aiohttp")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_async_retrieve(server, tmp_path):
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in (0, 6, 12)]
+    target = tmp_path / "data.grib2"
+
+    async def main():
+        async with AsyncClient(server.url) as client:
+            return await client.retrieve(
+                date=20260101,
+                time=0,
+                step=[0, 6, 12],
+                param=["10v", "2t"],
+                target=str(target),
+            )
+
+    result = run(main())
+
+    data = []
+    for url in urls:
+        data.append(server.files[url][:64])
+        data.append(server.files[url][192:])
+    assert target.read_bytes() == b"".join(data)
+    assert result.size == 3 * 2 * 64
+    assert result.plan.parts == 6
+
+    # One multi-range request per file, as Client.retrieve() does
+    assert [ranges for _, ranges in server.ranges] == [[(0, 63), (192, 255)]] * 3
+    assert result.plan.requests == 3
+
+
+def test_async_retrieve_single_ranges(server, tmp_path):
+    # The server only sends the first of several ranges
+    server.accept_multiple_ranges = False
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    target = tmp_path / "data.grib2"
+
+    async def main():
+        async with AsyncClient(server.url) as client:
+            return await client.retrieve(
+                date=20260101,
+                time=0,
+                param=["2t", "msl", "10v"],
+                target=str(target),
+            )
+
+    run(main())
+
+    data = server.files[url]
+    assert target.read_bytes() == data[:128] + data[192:]
+
+
+def test_async_retrieve_range_gap(server, tmp_path):
+    server.accept_multiple_ranges = False
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    target = tmp_path / "data.grib2"
+
+    async def main():
+        async with AsyncClient(server.url, source_range_gap=64) as client:
+            return await client.retrieve(
+                date=20260101,
+                time=0,
+                param=["msl", "10v"],
+                target=str(target),
+            )
+
+    result = run(main())
+
+    assert target.read_bytes() == server.files[url][64:128] + server.files[url][192:]
+    assert result.plan.requests == 1
+    assert len(server.ranges) == 1
+
+
+def test_async_download(server, tmp_path):
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in (0, 6)]
+    target = tmp_path / "data.grib2"
+
+    async def main():
+        async with AsyncClient(server.url) as client:
+            return await client.download(
+                date=20260101, time=0, step=[0, 6], target=str(target)
+            )
+
+    run(main())
+
+    assert target.read_bytes() == b"".join(server.files[url] for url in urls)
+
+
+def test_async_retry(server, tmp_path):
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    server.failures[url] = 2
+    target = tmp_path / "data.grib2"
+    retry = RetryPolicy(backoff=0.01, maximum_delay=0.05)
+
+    async def main(retry):
+        async with AsyncClient(server.url, retry=retry) as client:
+            return await client.retrieve(
+                date=20260101, time=0, param="msl", target=str(target)
+            )
+
+    run(main(retry))
+    assert target.read_bytes() == server.files[url][64:128]
+
+    server.failures[url] = 1
+    with pytest.raises(Exception, match="503"):
+        run(main(RetryPolicy(maximum_tries=1)))
+
+
+def test_async_circuit_breaker(server):
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    server.failures[url.replace(".grib2", ".index")] = 1000
+    retry = RetryPolicy(backoff=0.01, maximum_delay=0.05)
+    breaker = CircuitBreaker(failures=3, reset_after=60)
+
+    async def main():
+        async with AsyncClient(
+            server.url, retry=retry, circuit_breaker=breaker
+        ) as client:
+            return await client.get_index(server.url + url)
+
+    with pytest.raises(CircuitOpenError):
+        run(main())
+    assert len(server.requests["GET"]) == 3
+
+
+def test_async_latest(server):
+    yesterday = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+    server.add_file(yesterday.strftime("%Y%m%d"), 0, 0, FIELDS)
+
+    async def main():
+        async with AsyncClient(server.url) as client:
+            return await client.latest(time=0, step=0, param="2t")
+
+    assert run(main()) == datetime.datetime(
+        yesterday.year, yesterday.month, yesterday.day
+    )
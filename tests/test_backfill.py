@@ -0,0 +1,55 @@
+from server import FIELDS
+
+from ecmwf.opendata import backfill as module
+from ecmwf.opendata.backfill import backfill, runs
+
+
+def test_runs(monkeypatch):
+    # No client is created in the calling process
+    monkeypatch.setattr(module, "Client", None)
+    requests = runs(
+        dict(date="20260101/to/20260102", time=[0, 12], param="2t"),
+        "data-{date}-{time}.grib2",
+    )
+
+    assert [(r["date"], r["time"], r["target"]) for r in requests] == [
+        ("20260101", "0", "data-20260101-00.grib2"),
+        ("20260101", "12", "data-20260101-12.grib2"),
+        ("20260102", "0", "data-20260102-00.grib2"),
+        ("20260102", "12", "data-20260102-12.grib2"),
+    ]
+
+
+def test_backfill(server, tmp_path):
+    urls = {}
+    for date in (20260101, 20260102, 20260103):
+        for time in (0, 12):
+            urls[date, time] = server.add_file(date, time, 0, FIELDS)
+    # One run is not available
+    del server.files[urls[20260102, 12]]
+
+    completed = []
+    result = backfill(
+        dict(date="20260101/to/20260103", time=[0, 12], param="msl"),
+        str(tmp_path / "{date}{time}.grib2"),
+        processes=2,
+        retries=1,
+        retry_after=0,
+        callback=completed.append,
+        source=server.url,
+    )
+
+    assert [(r.date, r.time) for r in result] == [
+        (str(date), str(time)) for date, time in urls
+    ]
+    assert sorted(r.target for r in completed) == sorted(r.target for r in result)
+
+    for run in result:
+        if (run.date, run.time) == ("20260102", "12"):
+            assert run.error is not None
+            assert run.attempts == 2
+            continue
+        assert run.error is None
+        assert run.result.size == 64
+        data = server.files[urls[int(run.date), int(run.time)]][64:128]
+        assert (tmp_path / f"{run.date}{int(run.time):02d}.grib2").read_bytes() == data
@@ -0,0 +1,154 @@
+import datetime
+import os
+import time
+
+from freezegun import freeze_time
+from server import FIELDS
+
+from ecmwf.opendata import Client
+from ecmwf.opendata.cache import FieldCache, IndexCache, LatestCache
+
+
+def test_index_cache(server, tmp_path):
+    urls = [server.url + server.add_file(20260101, 0, step, FIELDS) for step in (0, 6)]
+
+    client = Client(server.url, index_cache=str(tmp_path))
+    first = client.get_parts(urls, {"param": ["msl"]})
+    assert len(server.requests["GET"]) == 2
+
+    client = Client(server.url, index_cache=str(tmp_path))
+    second = client.get_parts(urls, {"param": ["msl"]})
+    assert len(server.requests["GET"]) == 2
+
+    assert first == second
+
+
+def test_field_cache(server, tmp_path):
+    steps = [0, 6]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+    cache = tmp_path / "fields"
+
+    client = Client(server.url, field_cache=str(cache), source_accept_ranges=True)
+    client.retrieve(
+        date=20260101,
+        time=0,
+        step=steps,
+        param=["2t", "10u"],
+        target=str(tmp_path / "first.grib2"),
+    )
+    assert len(server.ranges) == 2
+
+    # Overlapping request: only the fields not in the cache are downloaded
+    server.reset()
+    client.retrieve(
+        date=20260101,
+        time=0,
+        step=steps,
+        param=["2t", "10u", "10v"],
+        target=str(tmp_path / "second.grib2"),
+    )
+    assert [ranges for _, ranges in server.ranges] == [[(192, 255)], [(192, 255)]]
+
+    data = b"".join(
+        server.files[url][i * 64 : (i + 1) * 64] for url in urls for i in (0, 2, 3)
+    )
+    assert (tmp_path / "second.grib2").read_bytes() == data
+
+    # Everything is cached
+    server.reset()
+    client.retrieve(
+        date=20260101,
+        time=0,
+        step=steps,
+        param=["10v", "2t"],
+        target=str(tmp_path / "third.grib2"),
+    )
+    assert server.ranges == []
+
+
+def test_field_cache_max_size(tmp_path):
+    cache = FieldCache(tmp_path, max_size=1000)
+    for i in range(40):
+        cache.put("http://host/a.grib2", i * 100, 100, b"x" * 100)
+        time.sleep(0.001)
+
+    assert cache.get("http://host/a.grib2?sig=1", 3900, 100) == b"x" * 100
+    assert cache.get("http://host/a.grib2", 0, 100) is None
+    assert sum(os.path.getsize(tmp_path / n) for n in os.listdir(tmp_path)) <= 1100
+
+
+def test_index_cache_max_age(tmp_path):
+    cache = IndexCache(tmp_path, max_age=60)
+    cache.put("http://host/a.index", [{"param": "2t"}])
+    assert cache.get("http://host/a.index") == [{"param": "2t"}]
+
+    path = cache._path("http://host/a.index")
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert cache.get("http://host/a.index") is None
+
+
+def test_index_cache_max_size(tmp_path):
+    cache = IndexCache(tmp_path, max_size=None)
+    for i in range(4):
+        cache.put(f"http://host/{i}.index", [{"param": "2t"}] * 100)
+
+    size = os.path.getsize(cache._path("http://host/0.index"))
+    now = time.time()
+    for i in range(4):
+        os.utime(cache._path(f"http://host/{i}.index"), (now + i, now))
+
+    cache.max_size = 2 * size
+    cache.evict()
+
+    assert cache.get("http://host/0.index") is None
+    assert cache.get("http://host/1.index") is None
+    assert cache.get("http://host/2.index") is not None
+    assert cache.get("http://host/3.index") is not None
+
+
+def test_latest_cache_expiry():
+    cache = LatestCache(ttl=60, publication_delay=4 * 3600)
+    run = datetime.datetime(2026, 1, 1, 0)
+    six_hours = datetime.timedelta(hours=6)
+
+    with freeze_time("2026-01-01T08:00:00Z"):
+        cache.put("key", run, six_hours)
+
+    # The 06 run cannot be published before 10:00
+    with freeze_time("2026-01-01T09:59:00Z"):
+        assert cache.get("key") == run
+    with freeze_time("2026-01-01T10:00:00Z"):
+        assert cache.get("key") is None
+
+    # Once the next run may be available, results are reused for `ttl`
+    with freeze_time("2026-01-01T11:00:00Z"):
+        cache.put("key", run, six_hours)
+    with freeze_time("2026-01-01T11:00:59Z"):
+        assert cache.get("key") == run
+    with freeze_time("2026-01-01T11:01:00Z"):
+        assert cache.get("key") is None
+
+
+def test_latest_cache_persistent(tmp_path):
+    path = tmp_path / "latest.json"
+    run = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+
+    LatestCache(path).put("key", run, datetime.timedelta(hours=6))
+
+    assert LatestCache(path).get("key") == run
+    assert LatestCache(path).get("other") is None
+
+
+def test_index_cache_evict_throttled(tmp_path):
+    cache = IndexCache(tmp_path, max_size=16 * 4096)
+    calls = []
+    cache.evict = lambda: calls.append(cache.written)
+
+    for i in range(20):
+        cache.put(f"http://host/{i}.index", [{"param": "2t"}] * 100)
+
+    # The directory is only scanned after max_size / 16 bytes are written
+    size = os.path.getsize(cache._path("http://host/0.index"))
+    assert size < 4096
+    assert 0 < len(calls) <= 20 * size // 4096
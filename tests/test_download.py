@@ -0,0 +1,397 @@
+import tempfile
+
+import pytest
+from server import FIELDS
+
+from ecmwf.opendata import Client
+
+
+def expected(server, urls, fields):
+    data = []
+    for url in urls:
+        content = server.files[url]
+        data.extend(content[i * 64 : (i + 1) * 64] for i in fields)
+    return b"".join(data)
+
+
+def test_retrieve(server, tmp_path):
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in (0, 6, 12)]
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url)
+    result = client.retrieve(
+        date=20260101,
+        time=0,
+        step=[0, 6, 12],
+        param=["10v", "2t"],
+        target=str(target),
+    )
+
+    assert target.read_bytes() == expected(server, urls, [0, 3])
+    assert result.size == 3 * 2 * 64
+    assert result.urls == [(server.url + url, ((0, 64), (192, 64))) for url in urls]
+
+
+@pytest.mark.parametrize("download_concurrency", [1, 2])
+def test_retrieve_preserve_request_order(server, tmp_path, download_concurrency):
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in (0, 6)]
+    target = tmp_path / "data.grib2"
+
+    client = Client(
+        server.url,
+        preserve_request_order=True,
+        download_concurrency=download_concurrency,
+    )
+    result = client.retrieve(
+        date=20260101,
+        time=0,
+        step=[0, 6],
+        param=["10v", "2t"],
+        target=str(target),
+    )
+
+    assert target.read_bytes() == expected(server, urls, [3, 0])
+    assert result.size == 2 * 2 * 64
+    assert result.stats.bytes >= result.size
+
+
+def test_retrieve_monthly(server, tmp_path):
+    fields = [{"type": "fcmean", "param": p} for p in ("2t", "msl", "tp")]
+    urls = [server.add_file(20260601, 0, m, fields, stream="mmsf") for m in (1, 2)]
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url)
+    result = client.retrieve(
+        date=20260601,
+        time=0,
+        stream="mmsa",
+        type="fcmean",
+        fcmonth=[1, 2],
+        param="tp",
+        target=str(target),
+    )
+
+    assert [url for url, _ in result.urls] == [server.url + url for url in urls]
+    assert urls[0].endswith("/mmsf/20260601000000-1m-mmsf-fc.grib2")
+    assert target.read_bytes() == expected(server, urls, [2])
+
+
+def test_retrieve_pipelined(server, tmp_path):
+    server.delay = 0.1
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in range(0, 36, 6)]
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url, concurrency=2, source_accept_ranges=True)
+    client.retrieve(
+        date=20260101,
+        time=0,
+        step=list(range(0, 36, 6)),
+        param="msl",
+        target=str(target),
+    )
+
+    assert target.read_bytes() == expected(server, urls, [1])
+
+    # The first data file is requested before the last index is received
+    first_data = server.log.index(("GET", urls[0]))
+    last_index = server.log.index(("DONE", urls[-1].replace(".grib2", ".index")))
+    assert first_data < last_index
+
+
+def test_retrieve_no_match(server, tmp_path):
+    server.add_file(20260101, 0, 0, FIELDS)
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url)
+    with pytest.raises(ValueError):
+        client.retrieve(date=20260101, time=0, param="xxx", target=str(target))
+
+    assert not target.exists()
+
+
+@pytest.mark.parametrize("gap", [0, 64])
+@pytest.mark.parametrize("accept_multiple_ranges", [True, False])
+def test_retrieve_range_gap(server, tmp_path, accept_multiple_ranges, gap):
+    server.accept_multiple_ranges = accept_multiple_ranges
+    fields = [{"param": p, "levelist": lev} for lev in (1000, 500) for p in "tuvz"]
+    url = server.add_file(20260101, 0, 0, fields)
+    target = tmp_path / "data.grib2"
+
+    client = Client(
+        server.url,
+        source_accept_ranges=True,
+        source_accept_multiple_ranges=accept_multiple_ranges,
+        source_range_gap=gap,
+    )
+    result = client.retrieve(
+        date=20260101,
+        time=0,
+        param=["t", "v"],
+        levelist=[1000, 500],
+        target=str(target),
+    )
+
+    assert target.read_bytes() == expected(server, [url], [0, 2, 4, 6])
+    assert result.plan.parts == 4
+    if gap:
+        # The fields are 64 bytes apart, so they are all merged
+        assert result.plan.requests == 1
+        assert result.plan.over_read == 3 * 64
+    else:
+        assert result.plan.requests == (1 if accept_multiple_ranges else 4)
+        assert result.plan.over_read == 0
+    assert len(server.ranges) == result.plan.requests
+
+
+def test_retrieve_parallel(server, tmp_path):
+    server.delay = 0.05
+    steps = list(range(0, 48, 6))
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+    target = tmp_path / "data.grib2"
+
+    client = Client(
+        server.url,
+        download_concurrency=4,
+        max_connections_per_host=2,
+        source_accept_ranges=True,
+    )
+    result = client.retrieve(
+        date=20260101,
+        time=0,
+        step=steps,
+        param=["msl", "10v"],
+        target=str(target),
+    )
+
+    assert target.read_bytes() == expected(server, urls, [1, 3])
+    assert result.size == len(urls) * 2 * 64
+    assert server.max_active == 2
+
+
+def test_download_parallel(server, tmp_path):
+    steps = [0, 6, 12]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url, download_concurrency=3)
+    client.download(date=20260101, time=0, step=steps, target=str(target))
+
+    assert target.read_bytes() == b"".join(server.files[url] for url in urls)
+
+
+def test_retrieve_resume(server, tmp_path):
+    steps = [0, 6, 12]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+    target = tmp_path / "data.grib2"
+    journal = tmp_path / "data.grib2.journal"
+
+    client = Client(server.url, resume_transfers=True, source_accept_ranges=True)
+    request = dict(date=20260101, time=0, step=steps, param=["2t", "10u"])
+
+    # Interrupt the transfer by removing the last data file
+    data = server.files.pop(urls[-1])
+    with pytest.raises(Exception):
+        client.retrieve(request, target=str(target))
+
+    assert journal.exists()
+    assert target.read_bytes() == expected(server, urls[:2], [0, 2])
+
+    server.files[urls[-1]] = data
+    server.reset()
+    result = client.retrieve(request, target=str(target))
+
+    assert target.read_bytes() == expected(server, urls, [0, 2])
+    assert result.size == 3 * 2 * 64
+    assert [path for path, _ in server.ranges] == [urls[-1]]
+    assert not journal.exists()
+
+
+@pytest.mark.parametrize("download_concurrency", [1, 2])
+def test_retrieve_resume_fewer(server, tmp_path, download_concurrency):
+    steps = [0, 6, 12]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+    target = tmp_path / "data.grib2"
+
+    client = Client(
+        server.url,
+        resume_transfers=True,
+        source_accept_ranges=True,
+        download_concurrency=download_concurrency,
+    )
+    request = dict(date=20260101, time=0, param=["2t", "10u"])
+
+    server.files.pop(urls[-1])
+    with pytest.raises(Exception):
+        client.retrieve(dict(request, step=steps), target=str(target))
+
+    # Every element of the new request is in the journal
+    result = client.retrieve(dict(request, step=[0]), target=str(target))
+
+    assert target.read_bytes() == expected(server, urls[:1], [0, 2])
+    assert result.size == 2 * 64
+    assert not (tmp_path / "data.grib2.journal").exists()
+
+
+def test_journal_mismatch(server, tmp_path):
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    target = tmp_path / "data.grib2"
+    target.write_bytes(b"x" * 64)
+    journal = tmp_path / "data.grib2.journal"
+    journal.write_text('{"url": "%s", "parts": [[64, 64]], "end": 64}\n' % url)
+
+    client = Client(server.url, resume_transfers=True, source_accept_ranges=True)
+    client.retrieve(date=20260101, time=0, param="2t", target=str(target))
+
+    assert target.read_bytes() == expected(server, [url], [0])
+    assert not journal.exists()
+
+
+def test_stream(server, tmp_path):
+    fields = [{"param": p, "levelist": lev} for lev in (1000, 500) for p in "tz"]
+    urls = [server.add_file(20260101, 0, step, fields) for step in (0, 6)]
+
+    client = Client(server.url, source_accept_ranges=True)
+    stream = client.stream(
+        date=20260101, time=0, step=[0, 6], param="z", levelist=[1000, 500]
+    )
+
+    received = list(stream)
+    assert [(e["step"], e["param"], e["levelist"]) for e, _ in received] == [
+        ("0", "z", "1000"),
+        ("0", "z", "500"),
+        ("6", "z", "1000"),
+        ("6", "z", "500"),
+    ]
+    assert b"".join(data for _, data in received) == expected(server, urls, [1, 3])
+    assert all(e["_length"] == len(data) for e, data in received)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stream_close(server):
+    server.delay = 0.05
+    steps = list(range(0, 48, 6))
+    for step in steps:
+        server.add_file(20260101, 0, step, FIELDS)
+
+    client = Client(server.url, source_accept_ranges=True)
+    stream = client.stream(date=20260101, time=0, step=steps, param="2t")
+
+    entry, data = next(stream)
+    assert entry["step"] == "0"
+    stream.close()
+
+    # The transfer stops when the generator is closed
+    assert len(server.ranges) < len(steps)
+
+
+def test_stream_no_index(server):
+    client = Client(server.url)
+    with pytest.raises(ValueError, match="index files"):
+        next(client.stream(date=20260101, time=0, type="tf", step=0))
+
+    assert server.requests == {}
+
+
+@pytest.mark.parametrize("download_concurrency", [1, 3])
+def test_retrieve_buffer(server, tmp_path, download_concurrency):
+    steps = [0, 6, 12]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+
+    client = Client(
+        server.url,
+        download_concurrency=download_concurrency,
+        source_accept_ranges=True,
+    )
+    result = client.retrieve_buffer(
+        date=20260101, time=0, step=steps, param=["10v", "2t"]
+    )
+
+    assert len(result.buffer) == result.size == 3 * 2 * 64
+    assert result.buffer == expected(server, urls, [0, 3])
+    assert [(e["step"], e["param"]) for e, _ in result.fields] == [
+        (str(step), param) for step in steps for param in ("2t", "10v")
+    ]
+    for entry, view in result.fields:
+        assert view.obj is result.buffer.obj
+        data = server.files[urls[steps.index(int(entry["step"]))]]
+        start = entry["_offset"]
+        assert view == data[start : start + entry["_length"]]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_retrieve_buffer_no_index(server):
+    client = Client(server.url)
+    with pytest.raises(ValueError, match="index files"):
+        client.retrieve_buffer(date=20260101, time=0, type="tf", step=0)
+
+    assert server.requests == {}
+
+
+def test_retrieve_many(server, tmp_path):
+    steps = [0, 6, 12]
+    urls = [server.add_file(20260101, 0, step, FIELDS) for step in steps]
+
+    client = Client(server.url, download_concurrency=2, source_accept_ranges=True)
+    run = dict(date=20260101, time=0)
+    results = client.retrieve_many(
+        [
+            dict(run, step=steps, param="2t", target=str(tmp_path / "a")),
+            dict(run, step=[0, 6], param=["2t", "10u"], target=str(tmp_path / "b")),
+            dict(run, step=12, target=str(tmp_path / "c")),
+        ]
+    )
+
+    assert (tmp_path / "a").read_bytes() == expected(server, urls, [0])
+    assert (tmp_path / "b").read_bytes() == expected(server, urls[:2], [0, 2])
+    assert (tmp_path / "c").read_bytes() == server.files[urls[2]]
+    assert [r.size for r in results] == [3 * 64, 4 * 64, 4 * 64]
+
+    # Each index and each field is downloaded once
+    indexes = [path for path in server.requests["GET"] if path.endswith(".index")]
+    assert sorted(indexes) == sorted(url.replace(".grib2", ".index") for url in urls)
+    ranges = dict(server.ranges)
+    assert ranges[urls[0]] == ranges[urls[1]] == [(0, 63), (128, 191)]
+    assert len(server.ranges) == 3
+    # The whole file is downloaded for the third request, and also used
+    # for the first one
+    assert server.requests["GET"].count(urls[2]) == 1
+
+
+def test_retrieve_many_staging(server, tmp_path, monkeypatch):
+    server.add_file(20260101, 0, 0, FIELDS)
+    # The downloads are staged next to the targets, not in the system
+    # temporary directory
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "missing"))
+
+    client = Client(server.url, source_accept_ranges=True)
+    run = dict(date=20260101, time=0, step=0)
+    client.retrieve_many(
+        [
+            dict(run, param="2t", target=str(tmp_path / "a")),
+            dict(run, param="msl", target=str(tmp_path / "b")),
+        ]
+    )
+
+    assert (tmp_path / "a").stat().st_size == (tmp_path / "b").stat().st_size == 64
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a", "b"]
+
+
+def test_retrieve_shards(server, tmp_path):
+    steps = list(range(0, 30, 6))
+    for step in steps:
+        server.add_file(20260101, 0, step, FIELDS)
+    request = dict(date=20260101, time=0, step=steps, param=["2t", "msl", "10v"])
+
+    client = Client(server.url, source_accept_ranges=True)
+    client.retrieve(request, target=str(tmp_path / "all.grib2"))
+
+    targets = [str(tmp_path / f"shard{i}.grib2") for i in range(4)]
+    sizes = [
+        client.retrieve_shard(i, 4, request, target=target).size
+        for i, target in enumerate(targets)
+    ]
+    assert sorted(sizes) == [192, 256, 256, 256]
+
+    merged = tmp_path / "merged.grib2"
+    client.merge_shards(targets, str(merged))
+    assert merged.read_bytes() == (tmp_path / "all.grib2").read_bytes()
@@ -0,0 +1,99 @@
+import json
+import pickle
+import random
+
+import pytest
+
+from ecmwf.opendata.index import Index
+
+
+def make_lines(seed=0):
+    random.seed(seed)
+    lines = []
+    offset = 0
+    for number in range(5):
+        for param in ("t", "u", "v", "2t", "msl"):
+            entry = {"type": "pf", "number": str(number), "param": param}
+            if param in ("t", "u", "v"):
+                for level in ("1000", "500"):
+                    lines.append(dict(entry, levelist=level))
+            else:
+                lines.append(entry)
+    random.shuffle(lines)
+    for entry in lines:
+        length = random.randint(10, 100)
+        entry.update(_offset=offset, _length=length)
+        offset += length
+    return [json.dumps(line).encode() for line in lines]
+
+
+def reference(lines, for_index, preserve_request_order):
+    # The original per-line matching of Client.get_parts
+    count = len(for_index)
+    parts = []
+    for line in lines:
+        line = json.loads(line)
+        matches = []
+        for i, (name, values) in enumerate(for_index.items()):
+            idx = line.get(name)
+            if idx in values:
+                if preserve_request_order:
+                    matches.append((i, values.index(idx)))
+                else:
+                    matches.append(line["_offset"])
+        if len(matches) == count:
+            parts.append((tuple(matches), (line["_offset"], line["_length"])))
+    return [p[1] for p in sorted(parts)]
+
+
+@pytest.mark.parametrize("preserve_request_order", [False, True])
+@pytest.mark.parametrize(
+    "for_index",
+    [
+        {"param": ["msl"]},
+        {"param": ["v", "t"], "levelist": ["500", "1000"]},
+        {"levelist": ["500"], "number": ["3", "0", "1"], "param": ["u", "t"]},
+        {"param": ["2t"], "levelist": ["500"]},
+        {"param": ["xxx"]},
+        {"param": ["2t"], "foo": ["bar"]},
+    ],
+)
+def test_index_match(for_index, preserve_request_order):
+    lines = make_lines()
+    index = Index.from_lines(lines)
+    expected = reference(lines, for_index, preserve_request_order)
+
+    assert len(index) == len(lines)
+    assert index.match(for_index, preserve_request_order) == expected
+
+    # Cached indexes are matched with their postings
+    index = pickle.loads(pickle.dumps(index))
+    assert index.match(for_index, preserve_request_order) == expected
+
+
+def test_index_from_lines():
+    lines = make_lines()
+    expected = Index.from_lines(lines).entries(range(len(lines)))
+
+    # Blank lines, whole batches of them, and decoded lines are accepted
+    lines = [b""] * 4 + lines[:7] + [b""] * 4 + lines[7:]
+    assert Index.from_lines(lines, batch=4).entries(range(len(expected))) == expected
+
+    index = Index.from_lines((line.decode() for line in lines), batch=3)
+    assert index.entries(range(len(expected))) == expected
+
+
+def test_index_possible_values():
+    index = Index.from_lines(make_lines())
+
+    assert set(index.possible_values("levelist")) == {"1000", "500"}
+    assert set(index.possible_values("number")) == {str(n) for n in range(5)}
+    assert set(index.possible_values("foo")) == set()
+
+
+def test_index_pickle():
+    lines = make_lines()
+    index = pickle.loads(pickle.dumps(Index.from_lines(lines)))
+
+    for_index = {"param": ["v", "t"], "levelist": ["500", "1000"]}
+    assert index.match(for_index, True) == reference(lines, for_index, True)
@@ -0,0 +1,76 @@
+from server import FIELDS
+
+from ecmwf.opendata import Client, Hooks, Metrics, PrometheusMetrics
+
+
+def test_prometheus_render(tmp_path):
+    metrics = PrometheusMetrics()
+    metrics.inc("opendata_received_bytes_total", 100, host="a")
+    metrics.inc("opendata_received_bytes_total", 28, host="a")
+    metrics.inc("opendata_received_bytes_total", 1, host='b"')
+    metrics.observe("opendata_phase_seconds", 0.02, phase="index")
+    metrics.observe("opendata_phase_seconds", 0.5, phase="index")
+    metrics.observe("opendata_phase_seconds", 60, phase="index")
+
+    text = metrics.render()
+    assert text.splitlines()[:2] == [
+        "# HELP opendata_phase_seconds Time spent in each phase of the client calls",
+        "# TYPE opendata_phase_seconds histogram",
+    ]
+    for line in (
+        'opendata_phase_seconds_bucket{phase="index",le="0.01"} 0',
+        'opendata_phase_seconds_bucket{phase="index",le="0.025"} 1',
+        'opendata_phase_seconds_bucket{phase="index",le="0.5"} 2',
+        'opendata_phase_seconds_bucket{phase="index",le="10"} 2',
+        'opendata_phase_seconds_bucket{phase="index",le="+Inf"} 3',
+        'opendata_phase_seconds_sum{phase="index"} 60.52',
+        'opendata_phase_seconds_count{phase="index"} 3',
+        "# TYPE opendata_received_bytes_total counter",
+        'opendata_received_bytes_total{host="a"} 128',
+        'opendata_received_bytes_total{host="b\\""} 1',
+    ):
+        assert line in text.splitlines()
+
+    path = tmp_path / "opendata.prom"
+    metrics.write(str(path))
+    assert path.read_text() == text
+
+
+def test_client_metrics(server, tmp_path):
+    url = server.add_file(20260601, 0, 0, FIELDS)
+    metrics = PrometheusMetrics()
+    hooks = Hooks()
+
+    client = Client(
+        server.url,
+        metrics=metrics,
+        hooks=hooks,
+        index_cache=str(tmp_path / "cache"),
+    )
+    for _ in range(2):
+        client.retrieve(
+            date=20260601,
+            time=0,
+            step=0,
+            param="msl",
+            target=str(tmp_path / "data.grib2"),
+        )
+
+    host = server.url.split("//")[1]
+    index = server.files[url.replace(".grib2", ".index")]
+    lines = metrics.render().splitlines()
+    for line in (
+        'opendata_cache_lookups_total{cache="index",result="hit"} 1',
+        'opendata_cache_lookups_total{cache="index",result="miss"} 1',
+        f'opendata_requests_total{{host="{host}",kind="index",method="GET",status="200"}} 1',
+        f'opendata_request_seconds_count{{host="{host}",kind="data"}} 2',
+        f'opendata_received_bytes_total{{host="{host}"}} {2 * 64 + len(index)}',
+    ):
+        assert line in lines
+
+
+def test_metrics_default():
+    metrics = Metrics()
+    metrics.inc("opendata_requests_total", method="GET")
+    metrics.observe("opendata_request_seconds", 0.1)
+    assert Client().hooks is None
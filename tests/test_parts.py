@@ -0,0 +1,72 @@
+from server import FIELDS
+
+from ecmwf.opendata import Client
+
+
+def test_get_parts_concurrent(server):
+    server.delay = 0.05
+    urls = [
+        server.url + server.add_file(20260101, 0, step, FIELDS)
+        for step in range(0, 48, 3)
+    ]
+
+    client = Client(server.url, concurrency=4)
+    result = client.get_parts(urls, {"param": ["msl"]})
+
+    assert [url for url, _ in result] == urls
+    assert all(parts == ((64, 64),) for _, parts in result)
+    assert len(server.requests["GET"]) == len(urls)
+    assert 1 < server.max_active <= 4
+
+
+def test_get_parts_serial(server):
+    urls = [server.url + server.add_file(20260101, 0, step, FIELDS) for step in (0, 6)]
+
+    client = Client(server.url, concurrency=1)
+    result = client.get_parts(urls, {"param": ["10v", "2t"]})
+
+    assert result == [(url, ((0, 64), (192, 64))) for url in urls]
+    assert server.max_active == 1
+
+
+def test_get_parts_preserve_request_order(server):
+    url = server.url + server.add_file(20260101, 0, 0, FIELDS)
+
+    client = Client(server.url, preserve_request_order=True)
+    result = client.get_parts([url], {"param": ["10v", "2t"]})
+
+    assert result == [(url, ((192, 64), (0, 64)))]
+
+
+def test_plan(server):
+    fields = [{"param": p, "levelist": lev} for lev in (1000, 500) for p in "tuvz"]
+    urls = [server.add_file(20260101, 0, step, fields) for step in (0, 6)]
+
+    client = Client(server.url, source_accept_multiple_ranges=False)
+    plan = client.plan(
+        date=20260101, time=0, step=[0, 6], param=["t", "u"], levelist=500
+    )
+
+    assert [f.url for f in plan.files] == [server.url + url for url in urls]
+    assert all(f.blocks == [(256, 128)] for f in plan.files)
+    assert (plan.parts, plan.requests, plan.bytes) == (4, 2, 4 * 64)
+
+    # z at 1000 hPa and t at 500 hPa are adjacent
+    plan = client.plan(date=20260101, time=0, step=[0, 6], param=["t", "z"])
+    assert plan.requests == 2 * 3
+    assert plan.bytes == 2 * 4 * 64
+
+    # Only the indexes are downloaded
+    assert all(path.endswith(".index") for path in server.requests["GET"])
+
+
+def test_plan_whole_files(server):
+    # Tropical cyclone tracks are downloaded whole
+    urls = [server.add_file(20260101, 0, step, FIELDS, type="tf") for step in (0, 6)]
+
+    client = Client(server.url)
+    plan = client.plan(date=20260101, time=0, step=[0, 6], type="tf")
+
+    assert [f.url for f in plan.files] == [server.url + url for url in urls]
+    assert (plan.parts, plan.requests, plan.bytes) == (0, 2, 2 * 4 * 64)
+    assert server.requests["GET"] == []
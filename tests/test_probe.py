@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+
+from ecmwf.opendata import Client
+
+FIELDS = [{"param": "2t"}]
+
+
+def run(day, time):
+    date = datetime.datetime.utcnow() - datetime.timedelta(days=day)
+    date = datetime.datetime(date.year, date.month, date.day, time)
+    return date, date.strftime("%Y%m%d")
+
+
+def test_latest_concurrent(server):
+    server.delay = 0.02
+    steps = list(range(0, 18, 3))
+
+    # Yesterday's 00 run is complete, today's 00 run is still being published
+    yesterday, yyyymmdd = run(1, 0)
+    for step in steps:
+        server.add_file(yyyymmdd, 0, step, FIELDS)
+
+    _, yyyymmdd = run(0, 0)
+    for step in steps[:-1]:
+        server.add_file(yyyymmdd, 0, step, FIELDS)
+
+    client = Client(server.url, concurrency=8)
+    assert client.latest(step=steps, param="2t") == yesterday
+    assert server.max_active > 1
+
+
+def test_latest_newest_first(server):
+    steps = [0, 6]
+    for day, time in ((1, 0), (1, 12), (0, 0)):
+        date, yyyymmdd = run(day, time)
+        for step in steps:
+            server.add_file(yyyymmdd, time, step, FIELDS)
+
+    client = Client(server.url, concurrency=4)
+    assert client.latest(step=steps, param="2t") == date
+    assert client.latest(step=steps, param="2t", time=12) == run(1, 12)[0]
+
+
+def test_latest_short_circuit(server):
+    server.delay = 0.02
+    steps = list(range(0, 30, 3))
+    date, yyyymmdd = run(2, 0)
+    server.add_file(yyyymmdd, 0, 0, FIELDS)
+
+    client = Client(server.url, concurrency=1)
+    with pytest.raises(ValueError):
+        client.latest(step=steps, time=0, param="2t")
+
+    # Each of the two candidate dates stops shortly after its first missing
+    # file, instead of probing all its steps
+    assert len(server.requests["HEAD"]) <= 4
+
+
+def test_latest_cached(server):
+    date, yyyymmdd = run(1, 0)
+    server.add_file(yyyymmdd, 0, 0, FIELDS)
+
+    client = Client(server.url)
+    assert client.latest(step=0, param="2t") == date
+    probes = len(server.requests["HEAD"])
+
+    assert client.latest(step=0, param="2t", target="other.grib2") == date
+    assert len(server.requests["HEAD"]) == probes
+
+    # Different files are probed for a different step
+    with pytest.raises(ValueError):
+        client.latest(step=6, param="2t")
+
+
+def test_latest_not_cached(server):
+    date, yyyymmdd = run(1, 0)
+    server.add_file(yyyymmdd, 0, 0, FIELDS)
+
+    client = Client(server.url, latest_cache=False)
+    assert client.latest(step=0, param="2t") == date
+    probes = len(server.requests["HEAD"])
+
+    assert client.latest(step=0, param="2t") == date
+    assert len(server.requests["HEAD"]) == 2 * probes
+
+
+@pytest.mark.parametrize("check_all", [False, True])
+def test_latest_sentinel(server, check_all):
+    steps = list(range(0, 30, 3))
+    date, yyyymmdd = run(1, 0)
+    for step in steps:
+        server.add_file(yyyymmdd, 0, step, FIELDS)
+
+    client = Client(server.url, latest_check_all=check_all, concurrency=1)
+    assert client.latest(step=steps, time=0, param="2t") == date
+
+    heads = server.requests["HEAD"]
+    if check_all:
+        assert len(heads) >= len(steps)
+    else:
+        # Today's last step, then yesterday's last step
+        assert len(heads) == 2
+        assert all("-27h-" in url for url in heads)
@@ -0,0 +1,85 @@
+from ecmwf.opendata.ranges import (
+    RangePlan,
+    ascending_runs,
+    coalesce,
+    count_requests,
+    single_range_groups,
+    split_parts,
+)
+
+
+def test_coalesce():
+    parts = [(0, 10), (10, 10), (25, 5), (100, 10)]
+
+    assert coalesce(parts) == [(0, 20), (25, 5), (100, 10)]
+    assert coalesce(parts, gap=5) == [(0, 30), (100, 10)]
+    assert coalesce(parts, gap=69) == [(0, 30), (100, 10)]
+    assert coalesce(parts, gap=70) == [(0, 110)]
+
+
+def test_ascending_runs():
+    assert ascending_runs([(10, 5), (20, 5), (0, 5), (30, 5)]) == [
+        [(10, 5), (20, 5)],
+        [(0, 5), (30, 5)],
+    ]
+
+
+def test_single_range_groups():
+    parts = [(0, 10), (10, 10), (25, 5), (100, 10), (0, 5)]
+
+    assert single_range_groups(parts) == [
+        [(0, 10), (10, 10)],
+        [(25, 5)],
+        [(100, 10)],
+        [(0, 5)],
+    ]
+    assert single_range_groups(parts, gap=5) == [
+        [(0, 10), (10, 10), (25, 5)],
+        [(100, 10)],
+        [(0, 5)],
+    ]
+
+
+def test_count_requests():
+    blocks = [(i * 1000, 10) for i in range(1000)]
+
+    assert count_requests(blocks, False) == 1000
+    assert count_requests(blocks, True) > 1
+    assert count_requests(blocks, True) < 100
+    assert count_requests(blocks[:10], None) == 1
+
+
+def test_range_plan():
+    plan = RangePlan(gap=1000, accept_multiple_ranges=False)
+    plan.add("a", [(i * 1500, 1000) for i in range(100)])
+    plan.add("b", [(0, 10)])
+
+    assert len(plan.files) == 2
+    assert plan.parts == 101
+    assert plan.requests == 2
+    assert plan.bytes == 100 * 1000 + 10
+    assert plan.over_read == 99 * 500
+
+
+def test_split_parts():
+    urls_and_parts = [
+        ("a", ((0, 10), (10, 10), (40, 30))),
+        ("b", ((0, 20),)),
+        ("c", ((100, 10), (0, 10), (50, 10))),
+    ]
+
+    shards = split_parts(urls_and_parts, 3)
+    assert shards == [
+        [("a", ((0, 10), (10, 10)))],
+        [("a", ((40, 30),)), ("b", ((0, 20),))],
+        [("c", ((100, 10), (0, 10), (50, 10)))],
+    ]
+
+    for count in range(1, 12):
+        shards = split_parts(urls_and_parts, count)
+        assert len(shards) == count
+        assert [p for shard in shards for _, parts in shard for p in parts] == [
+            p for _, parts in urls_and_parts for p in parts
+        ]
+        sizes = [sum(n for _, parts in shard for _, n in parts) for shard in shards]
+        assert max(sizes) - min(sizes) <= 30 + 10
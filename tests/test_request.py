@@ -48,5 +48,74 @@ def test_explicit_model_not_overridden_by_class():
     assert for_urls["model"] == ["ifs"]
 
 
+def test_prepare_request_cache():
+    client = Client()
+
+    for_urls, for_index = client.prepare_request(param=["2t", "msl"], step=[0, 6])
+    for_urls["step"].append("12")
+    for_index["param"].clear()
+
+    # Callers get their own copy of the cached result
+    for_urls, for_index = client.prepare_request(param=["2t", "msl"], step=[0, 6])
+    assert for_urls["step"] == ["0", "6"]
+    assert for_index["param"] == ["2t", "msl"]
+    assert client._prepared_requests.cache_info().hits == 1
+
+    # Lists and tuples are equivalent
+    client.prepare_request(param=("2t", "msl"), step=(0, 6))
+    assert client._prepared_requests.cache_info().hits == 2
+
+
+def test_prepare_request_cache_runs():
+    client = Client()
+
+    first, _ = client.prepare_request(date=20260101, time=0, param="2t")
+    second, _ = client.prepare_request(date="20260102/to/20260103", time=12, param="2t")
+
+    assert list(first) == list(second)
+    assert first["date"] == ["20260101"] and first["time"] == ["0"]
+    assert second["date"] == ["20260102", "20260103"] and second["time"] == ["12"]
+    assert client._prepared_requests.cache_info().hits == 1
+
+
+def test_get_urls_runs():
+    client = Client(source="http://host", infer_stream_keyword=True)
+
+    result = client._get_urls(
+        date="20260511/to/20260512", time=[0, 6], step=[0, 3], use_index=False
+    )
+
+    assert [url.split("/", 3)[3] for url in result.urls] == [
+        "20260511/00z/ifs/0p25/oper/20260511000000-0h-oper-fc.grib2",
+        "20260511/00z/ifs/0p25/oper/20260511000000-3h-oper-fc.grib2",
+        "20260511/06z/ifs/0p25/scda/20260511060000-0h-scda-fc.grib2",
+        "20260511/06z/ifs/0p25/scda/20260511060000-3h-scda-fc.grib2",
+        "20260512/00z/ifs/0p25/oper/20260512000000-0h-oper-fc.grib2",
+        "20260512/00z/ifs/0p25/oper/20260512000000-3h-oper-fc.grib2",
+        "20260512/06z/ifs/0p25/oper/20260512060000-0h-oper-fc.grib2",
+        "20260512/06z/ifs/0p25/oper/20260512060000-3h-oper-fc.grib2",
+    ]
+    assert len(result.datetime) == 4
+
+
+def test_get_urls_monthly():
+    client = Client(source="http://host")
+
+    result = client._get_urls(
+        date=20260601,
+        time=0,
+        stream="mmsa",
+        type="fcmean",
+        fcmonth=[1, 2],
+        use_index=False,
+    )
+
+    # The monthly means are published in the files of the mmsf stream
+    assert [url.split("/", 3)[3] for url in result.urls] == [
+        "20260601/00z/ifs/0p25/mmsf/20260601000000-1m-mmsf-fc.grib2",
+        "20260601/00z/ifs/0p25/mmsf/20260601000000-2m-mmsf-fc.grib2",
+    ]
+
+
 if __name__ == "__main__":
     test_request()
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+import requests
+from server import FIELDS
+
+from ecmwf.opendata import Client
+from ecmwf.opendata.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+FAST = dict(backoff=0.01, maximum_delay=0.05)
+
+
+def test_policy_delay():
+    policy = RetryPolicy(backoff=1, multiplier=2, maximum_delay=10, jitter=False)
+    assert [policy.delay(n) for n in range(1, 7)] == [1, 2, 4, 8, 10, 10]
+
+    policy = RetryPolicy(backoff=1, maximum_delay=10)
+    assert all(0 <= policy.delay(4) <= 8 for _ in range(100))
+
+
+def test_retrieve_retries(server, tmp_path):
+    url = server.add_file(20260601, 0, 0, FIELDS)
+    server.failures[url] = 2
+    server.failures[url.replace(".grib2", ".index")] = 1
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url, retry=RetryPolicy(**FAST))
+    result = client.retrieve(
+        date=20260601,
+        time=0,
+        step=0,
+        param="msl",
+        target=str(target),
+    )
+
+    assert target.read_bytes() == server.files[url][64:128]
+    assert result.stats.retries == 3
+
+
+def test_retrieve_single_range_retries(server, tmp_path):
+    url = server.add_file(20260601, 0, 0, FIELDS)
+    server.failures[(url, "bytes=192-255")] = 1
+    target = tmp_path / "data.grib2"
+
+    client = Client(
+        server.url,
+        retry=RetryPolicy(**FAST),
+        source_accept_ranges=True,
+        source_accept_multiple_ranges=False,
+    )
+    result = client.retrieve(
+        date=20260601,
+        time=0,
+        step=0,
+        param=["2t", "10v"],
+        target=str(target),
+    )
+
+    data = server.files[url]
+    assert target.read_bytes() == data[:64] + data[192:]
+    assert [ranges for _, ranges in server.ranges] == [[(0, 63)], [(192, 255)]]
+    assert result.stats.retries == 1
+
+
+def test_maximum_elapsed(server):
+    url = server.add_file(20260601, 0, 0, FIELDS)
+    server.failures[url] = 1000
+
+    client = Client(server.url, retry=RetryPolicy(maximum_elapsed=0.3, **FAST))
+    with pytest.raises(requests.HTTPError):
+        client._content_length(server.url + url)
+
+    assert 3 < len(server.requests["HEAD"]) < 1000
+
+
+def test_circuit_breaker(server):
+    url = server.add_file(20260601, 0, 0, FIELDS)
+    index = url.replace(".grib2", ".index")
+    server.failures[index] = 1000
+    breaker = CircuitBreaker(failures=3, reset_after=0.5)
+
+    client = Client(server.url, retry=RetryPolicy(**FAST), circuit_breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        client.get_index(server.url + url)
+    assert len(server.requests["GET"]) == 3
+
+    # The other files of the host fail without any request
+    with pytest.raises(CircuitOpenError):
+        client._content_length(server.url + url)
+    assert len(server.requests["HEAD"]) == 0
+
+    # Once the host is back, a request is let through after reset_after
+    server.failures.clear()
+    server.reset()
+    time.sleep(0.5)
+    assert client.get_index(server.url + url)
+    assert len(server.requests["GET"]) == 1
@@ -0,0 +1,101 @@
+import datetime
+
+import requests
+from server import FIELDS
+
+from ecmwf.opendata import Client, Hooks
+from ecmwf.opendata.stats import collect, instrument
+
+
+class Recorder(Hooks):
+    def __init__(self):
+        self.phases = set()
+        self.requests = []
+        self.transfers = []
+        self.stats = []
+
+    def on_phase(self, name, seconds):
+        self.phases.add(name)
+
+    def on_request(self, method, url, status, seconds):
+        self.requests.append((method, url, status))
+
+    def on_transfer(self, url, size, seconds):
+        self.transfers.append((url, size))
+
+    def on_stats(self, stats):
+        self.stats.append(stats)
+
+
+def test_retrieve_stats(server, tmp_path):
+    urls = [server.add_file(20260601, 0, step, FIELDS) for step in (0, 6)]
+    hooks = Recorder()
+
+    client = Client(server.url, hooks=hooks, concurrency=2)
+    result = client.retrieve(
+        date=20260601,
+        time=0,
+        step=[0, 6],
+        param=["2t", "10v"],
+        target=str(tmp_path / "data.grib2"),
+    )
+
+    stats = result.stats
+    assert hooks.stats == [stats]
+    assert hooks.phases == {"urls", "index", "parse", "transfer"}
+    assert set(stats.phases) == hooks.phases
+    assert stats.elapsed > 0
+
+    # Two index files, and the size and two ranges of each data file
+    assert stats.requests == {"GET": 4, "HEAD": 2}
+    assert stats.retries == 0
+    assert stats.bytes == result.size + sum(
+        len(server.files[url.replace(".grib2", ".index")]) for url in urls
+    )
+
+    host = stats.hosts[server.url.split("//")[1]]
+    assert host.requests == 6
+    assert host.bytes == stats.bytes
+    assert host.throughput > 0
+
+    assert sorted(hooks.transfers)[0] == (server.url + urls[0], 2 * 64)
+
+
+def test_download_stats(server, tmp_path):
+    urls = [server.add_file(20260601, 0, step, FIELDS) for step in (0, 6)]
+    target = tmp_path / "data.grib2"
+
+    client = Client(server.url)
+    result = client.download(date=20260601, time=0, step=[0, 6], target=str(target))
+
+    # multiurl does not return the size of several files
+    size = sum(len(server.files[url]) for url in urls)
+    assert result.size == target.stat().st_size == size
+    assert result.stats.bytes >= size
+    assert "transfer" in result.stats.phases
+
+
+def test_latest_stats(server):
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    server.add_file(yesterday.strftime("%Y%m%d"), 0, 0, FIELDS)
+    hooks = Recorder()
+
+    client = Client(server.url, hooks=hooks)
+    client.latest(time=0, step=0, param="2t")
+
+    assert "latest" in hooks.phases
+    assert len(hooks.stats) == 1
+    assert all(method == "HEAD" for method, _, _ in hooks.requests)
+
+
+def test_instrument_retries(server):
+    url = server.add_file(20260101, 0, 0, FIELDS)
+    server.failures[url] = 1
+    session = instrument(requests.Session())
+
+    with collect() as stats:
+        assert session.get(server.url + url).status_code == 503
+        assert session.get(server.url + url).status_code == 200
+
+    assert stats.requests == {"GET": 2}
+    assert stats.retries == 1
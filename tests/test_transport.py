@@ -0,0 +1,60 @@
+import pytest
+from server import FIELDS
+
+from ecmwf.opendata import Client
+
+
+def retrieve(client, tmp_path, param):
+    return client.retrieve(
+        date=20260601,
+        time=0,
+        step=[0, 6],
+        param=param,
+        target=str(tmp_path / "data.grib2"),
+    )
+
+
+def test_pool_size():
+    client = Client(concurrency=16, download_concurrency=8)
+    assert client.session.get_adapter("https://data.ecmwf.int") is client.transport
+    assert client.transport._pool_maxsize == 24
+
+    client = Client(max_connections_per_host=4)
+    assert client.transport._pool_maxsize == 10
+
+    client = Client(pool_connections=2, pool_maxsize=64)
+    assert client.transport._pool_connections == 2
+    assert client.transport._pool_maxsize == 64
+
+
+def test_shared_transport(server, tmp_path):
+    for step in (0, 6):
+        server.add_file(20260601, 0, step, FIELDS)
+
+    first = Client(server.url, concurrency=1)
+    second = Client(server.url, concurrency=1, transport=first.transport)
+    assert first.session is not second.session
+
+    retrieve(first, tmp_path, "2t")
+    retrieve(second, tmp_path, "msl")
+
+    # All the requests go through the same connection
+    assert len(server.connections) == 1
+
+    with pytest.raises(ValueError):
+        Client(server.url, transport=first.transport, pool_maxsize=4)
+
+
+def test_no_keep_alive(server, tmp_path):
+    for step in (0, 6):
+        server.add_file(20260601, 0, step, FIELDS)
+
+    client = Client(server.url, concurrency=1)
+    retrieve(client, tmp_path, "2t")
+    assert len(server.connections) == 1
+
+    server.reset()
+    client = Client(server.url, concurrency=1, keep_alive=False)
+    retrieve(client, tmp_path, "2t")
+    requests = sum(len(paths) for paths in server.requests.values())
+    assert len(server.connections) == requests